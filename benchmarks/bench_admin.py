@@ -0,0 +1,30 @@
+"""
+Benchmark of rendering the TaskModelAdmin changelist.
+"""
+from benchmarks.utils import measure, populate
+
+DEFAULT_SIZES = (100, 1000)
+
+
+def run(sizes=DEFAULT_SIZES):
+    from django.contrib import admin
+    from django.contrib.auth.models import User
+    from django.test import RequestFactory
+    from benchmarks.benchapp.models import BenchItem
+
+    user = User.objects.filter(username='bench').first()
+    if user is None:
+        user = User.objects.create_superuser('bench', 'bench@example.com',
+                                             'bench')
+    model_admin = admin.site._registry[BenchItem]
+
+    def render():
+        request = RequestFactory().get('/admin/benchapp/benchitem/')
+        request.user = user
+        model_admin.changelist_view(request).render()
+
+    for size in sizes:
+        populate(size, 2)
+        record = {'benchmark': 'admin.changelist', 'objects': size}
+        record.update(measure(render, repeat=5))
+        yield record
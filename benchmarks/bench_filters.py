@@ -0,0 +1,57 @@
+"""
+Benchmarks of the TaskFilterMixin filters for growing host tables.
+
+Every filter is measured in its current form (EXISTS, or an ``object_id``
+subquery on Django < 3.0) and in the JOIN (and ``exclude()``) form used
+before, which is rebuilt here with OR'ed Q objects.
+"""
+from django.db.models import Q
+
+from benchmarks.utils import measure, populate, explain
+
+DEFAULT_SIZES = (1000, 10000)
+TASKS_PER_OBJECT = 3
+
+FILTERS = (
+    ('with_running_tasks', 'RUNNING_STATES', True),
+    ('without_running_tasks', 'RUNNING_STATES', False),
+    ('with_ready_tasks', 'READY_STATES', True),
+    ('without_ready_tasks', 'READY_STATES', False),
+    ('with_tasks', None, True),
+)
+
+
+def join_filter(queryset, states, exists):
+    if states is None:
+        q = Q(tasks__state__isnull=False)
+    else:
+        q = Q()
+        for state in states:
+            q |= Q(tasks__state=state)
+    return queryset.filter(q) if exists else queryset.exclude(q)
+
+
+def run(sizes=DEFAULT_SIZES):
+    from djcelery_model.models import ModelTaskMetaState
+    from benchmarks.benchapp.models import BenchItem
+
+    for size in sizes:
+        populate(size, TASKS_PER_OBJECT)
+        for name, states, exists in FILTERS:
+            if states is not None:
+                states = getattr(ModelTaskMetaState, states)
+            querysets = (
+                ('exists', getattr(BenchItem.objects, name)()),
+                ('join', join_filter(BenchItem.objects.all(), states,
+                                     exists)),
+            )
+            for form, queryset in querysets:
+                record = {
+                    'benchmark': 'filters.%s.%s' % (name, form),
+                    'objects': size,
+                    'rows': queryset.count(),
+                    'plan': explain(queryset),
+                }
+                record.update(measure(lambda: list(queryset.all()),
+                                      repeat=5))
+                yield record
@@ -0,0 +1,64 @@
+"""
+Compare query plans and latencies of the TaskMixin accessors with and
+without the composite ModelTaskMeta indexes added in migration 0007. The
+indexes are dropped and re-created on the current schema; no migration is
+unapplied.
+
+    python -m benchmarks.bench_indexes [sizes...]
+
+Every result is printed as one JSON object per line.
+"""
+import sys
+
+from benchmarks.utils import setup_django, measure, explain, populate, emit
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+TASKS_PER_OBJECT = 10
+
+
+def accessor_querysets(instance):
+    return {
+        'running': instance.tasks.running(),
+        'ready': instance.tasks.ready(),
+        'last_ready_task': instance.tasks.ready().order_by(
+            '-updated_at', '-created_at')[:1],
+    }
+
+
+def set_composite_indexes(indexed):
+    from django.db import connection
+    from djcelery_model.models import ModelTaskMeta
+
+    index_together = ModelTaskMeta._meta.index_together
+    with connection.schema_editor() as schema_editor:
+        if indexed:
+            schema_editor.alter_index_together(ModelTaskMeta, (),
+                                               index_together)
+        else:
+            schema_editor.alter_index_together(ModelTaskMeta,
+                                               index_together, ())
+
+
+def run(sizes=DEFAULT_SIZES):
+    from benchmarks.benchapp.models import BenchItem
+
+    for size in sizes:
+        pks = populate(size // TASKS_PER_OBJECT, TASKS_PER_OBJECT)
+        instance = BenchItem.objects.get(pk=pks[len(pks) // 2])
+        for indexed in (False, True):
+            set_composite_indexes(indexed)
+            for name, queryset in accessor_querysets(instance).items():
+                record = {
+                    'benchmark': 'indexes.%s' % name,
+                    'table_rows': size,
+                    'indexed': indexed,
+                    'plan': explain(queryset),
+                }
+                record.update(measure(lambda: list(queryset.all())))
+                yield record
+
+
+if __name__ == '__main__':
+    setup_django()
+    for record in run([int(size) for size in sys.argv[1:]] or DEFAULT_SIZES):
+        emit(record)
@@ -0,0 +1,73 @@
+"""
+Benchmarks of the task tracking lifecycle: enqueueing, the signal handlers
+and the status read path for a growing number of tasks per object, with
+and without pruning on status reads.
+"""
+import itertools
+
+from benchmarks.utils import djcelery_model_settings, measure, populate
+
+DEFAULT_TASKS_PER_OBJECT = (1, 10, 100)
+
+
+def run(tasks_per_object=DEFAULT_TASKS_PER_OBJECT):
+    from djcelery_model.models import ModelTaskMeta, ModelTaskMetaState, \
+        handle_task_prerun, handle_task_postrun
+    from benchmarks.benchapp.models import BenchItem
+    from benchmarks.celery_app import noop
+
+    populate(100, 1)
+    instance = BenchItem.objects.first()
+
+    record = {'benchmark': 'lifecycle.apply_async'}
+    record.update(measure(lambda: instance.apply_async(noop), repeat=200))
+    yield record
+
+    record = {'benchmark': 'lifecycle.apply_async_many', 'instances': 100}
+    record.update(measure(
+        lambda: BenchItem.objects.all().apply_async_many(noop), repeat=10))
+    yield record
+
+    task_ids = itertools.cycle(list(
+        ModelTaskMeta.objects.values_list('task_id', flat=True)[:1000]))
+
+    def prerun():
+        handle_task_prerun(task_id=next(task_ids))
+
+    def postrun():
+        handle_task_postrun(task_id=next(task_ids), state='SUCCESS')
+
+    for name, func in (('task_prerun', prerun), ('task_postrun', postrun)):
+        record = {'benchmark': 'lifecycle.%s' % name}
+        record.update(measure(func, repeat=500))
+        yield record
+
+    for count in tasks_per_object:
+        populate(10, count)
+        pks = list(ModelTaskMeta.objects.values_list('pk', flat=True))
+        ModelTaskMeta.objects.filter(pk__in=pks[::2]).update(
+            state=ModelTaskMetaState.STARTED)
+        instance = BenchItem.objects.first()
+        record = {
+            'benchmark': 'lifecycle.read_task_status',
+            'tasks_per_object': count,
+        }
+        record.update(measure(instance.read_task_status))
+        yield record
+        record = {
+            'benchmark': 'lifecycle.get_task_statuses',
+            'tasks_per_object': count,
+            'instances': 10,
+        }
+        record.update(measure(
+            lambda: BenchItem.objects.get_task_statuses()))
+        yield record
+        # the default status path; only the first call has tasks to prune
+        record = {
+            'benchmark': 'lifecycle.get_task_status',
+            'tasks_per_object': count,
+            'prune_on_status': True,
+        }
+        with djcelery_model_settings(PRUNE_ON_STATUS=True):
+            record.update(measure(instance.get_task_status))
+        yield record
@@ -0,0 +1,66 @@
+"""
+Benchmarks of sharded task metas, run with BENCH_SHARDS=2 (or more):
+enqueueing, signal handler writes with and without a shard hint and status
+reads over all shards. Nothing is measured without shards.
+"""
+from benchmarks.utils import measure, populate
+
+N_OBJECTS = 100
+TASKS_PER_OBJECT = 10
+
+
+def run():
+    from djcelery_model.models import ModelTaskMeta, handle_task_prerun
+    from djcelery_model.sharding import get_shards, shard_hints
+    from benchmarks.benchapp.models import BenchItem
+    from benchmarks.celery_app import noop
+
+    if not get_shards():
+        return
+
+    populate(N_OBJECTS, TASKS_PER_OBJECT)
+    yield {
+        'benchmark': 'sharding.distribution',
+        'rows': dict((shard, ModelTaskMeta.objects.using(shard).count())
+                     for shard in get_shards()),
+    }
+
+    instance = BenchItem.objects.first()
+    record = {'benchmark': 'sharding.apply_async'}
+    record.update(measure(lambda: instance.apply_async(noop), repeat=200))
+    yield record
+
+    task_ids = []
+    for shard in get_shards():
+        shard_task_ids = list(ModelTaskMeta.objects.using(shard).values_list(
+            'task_id', flat=True)[:250])
+        task_ids.extend((task_id, shard) for task_id in shard_task_ids)
+    half = len(task_ids) // 2
+    hinted = iter(task_ids[:half])
+    unhinted = iter(task_ids[half:])
+
+    def prerun_hinted():
+        task_id, shard = next(hinted)
+        shard_hints.set(task_id, shard)
+        handle_task_prerun(task_id=task_id)
+
+    def prerun_unhinted():
+        # without a hint the state is written to every shard
+        task_id, shard = next(unhinted)
+        handle_task_prerun(task_id=task_id)
+
+    for name, func in (('task_prerun_hinted', prerun_hinted),
+                       ('task_prerun_unhinted', prerun_unhinted)):
+        record = {'benchmark': 'sharding.%s' % name,
+                  'shards': len(get_shards())}
+        # measure() calls func once more to count queries
+        record.update(measure(func, repeat=half - 1))
+        yield record
+
+    record = {
+        'benchmark': 'sharding.get_task_statuses',
+        'tasks_per_object': TASKS_PER_OBJECT,
+        'instances': N_OBJECTS,
+    }
+    record.update(measure(lambda: BenchItem.objects.get_task_statuses()))
+    yield record
@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from djcelery_model.admin import TaskModelAdmin
+
+from .models import BenchItem
+
+
+class BenchItemAdmin(TaskModelAdmin):
+    list_display = ('name',)
+
+
+admin.site.register(BenchItem, BenchItemAdmin)
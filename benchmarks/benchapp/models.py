@@ -0,0 +1,7 @@
+from django.db import models
+
+from djcelery_model.models import TaskMixin
+
+
+class BenchItem(TaskMixin, models.Model):
+    name = models.CharField(max_length=100)
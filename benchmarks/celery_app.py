@@ -0,0 +1,9 @@
+from celery import Celery
+
+app = Celery('benchmarks')
+app.config_from_object('django.conf:settings')
+
+
+@app.task(name='benchmarks.noop')
+def noop(*args, **kwargs):
+    return None
@@ -0,0 +1,46 @@
+"""
+Compare two benchmark result files written by ``benchmarks.run``.
+
+    python -m benchmarks.compare baseline.json current.json
+
+Prints the median latency and query count of every benchmark present in
+both files together with the relative change.
+"""
+import json
+import sys
+
+IGNORED_KEYS = ('min_ms', 'median_ms', 'max_ms', 'repeat', 'queries', 'plan')
+
+
+def load(path):
+    results = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record['benchmark'] == 'environment':
+                continue
+            key = tuple(sorted((k, v) for k, v in record.items()
+                               if k not in IGNORED_KEYS))
+            results[key] = record
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        sys.stderr.write(__doc__)
+        return 2
+    baseline, current = load(argv[0]), load(argv[1])
+    for key in sorted(set(baseline) & set(current)):
+        old, new = baseline[key], current[key]
+        change = (new['median_ms'] - old['median_ms']) / \
+            max(old['median_ms'], 1e-9) * 100.0
+        sys.stdout.write('%-70s %10.3fms %10.3fms %+7.1f%% %4d -> %d queries\n' % (
+            ' '.join('%s=%s' % item for item in key),
+            old['median_ms'], new['median_ms'], change,
+            old['queries'], new['queries']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Run the django-celery-model benchmarks without any external services.
+
+    python -m benchmarks.run [--output results.json] [benchmark ...]
+
+Results are written as JSON lines, preceded by a record describing the
+environment, and can be compared with ``python -m benchmarks.compare``.
+"""
+import argparse
+import importlib
+import platform
+import subprocess
+import sys
+
+from benchmarks.utils import setup_django, emit
+
+BENCHMARKS = ('lifecycle', 'filters', 'admin', 'indexes', 'sharding')
+
+
+def environment():
+    import celery
+    import django
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD']).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    from django.db import connection
+    return {
+        'benchmark': 'environment',
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'celery': celery.__version__,
+        'database': connection.vendor,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the django-celery-model benchmarks.')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='one of %s (default: all)' % ', '.join(BENCHMARKS))
+    parser.add_argument('--output', default=None,
+                        help='also write the results to this file')
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: %s' % name)
+
+    setup_django()
+    streams = [sys.stdout]
+    if args.output:
+        streams.append(open(args.output, 'w'))
+    try:
+        emit(environment(), *streams)
+        for name in args.benchmarks or BENCHMARKS:
+            module = importlib.import_module('benchmarks.bench_%s' % name)
+            for record in module.run():
+                emit(record, *streams)
+    finally:
+        for stream in streams[1:]:
+            stream.close()
+
+
+if __name__ == '__main__':
+    main()
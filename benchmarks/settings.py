@@ -0,0 +1,71 @@
+"""
+Django settings for the django-celery-model benchmarks.
+
+SQLite in memory is used by default; set BENCH_DATABASE_ENGINE (and the
+other BENCH_DATABASE_* variables) to benchmark against another database.
+BENCH_SHARDS=n spreads the task metas over n further in-memory SQLite
+databases.
+Celery publishes to the in-memory transport and stores results in memory,
+so no broker or worker is needed.
+"""
+import os
+
+SECRET_KEY = 'djcelery-model-benchmarks'
+DEBUG = False
+USE_TZ = True
+
+DATABASES = {
+    'default': {
+        'ENGINE': os.environ.get('BENCH_DATABASE_ENGINE',
+                                 'django.db.backends.sqlite3'),
+        'NAME': os.environ.get('BENCH_DATABASE_NAME', ':memory:'),
+        'USER': os.environ.get('BENCH_DATABASE_USER', ''),
+        'PASSWORD': os.environ.get('BENCH_DATABASE_PASSWORD', ''),
+        'HOST': os.environ.get('BENCH_DATABASE_HOST', ''),
+        'PORT': os.environ.get('BENCH_DATABASE_PORT', ''),
+    },
+}
+
+SHARDS = tuple('shard%d' % i
+               for i in range(int(os.environ.get('BENCH_SHARDS', 0))))
+for _alias in SHARDS:
+    DATABASES[_alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+DATABASE_ROUTERS = ['djcelery_model.sharding.TaskShardRouter'] \
+    if SHARDS else []
+
+INSTALLED_APPS = (
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.messages',
+    'django.contrib.sessions',
+    'djcelery_model',
+    'benchmarks.benchapp',
+)
+
+ROOT_URLCONF = 'benchmarks.urls'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+            ],
+        },
+    },
+]
+
+BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
+
+DJCELERY_MODEL = {
+    'WORKER_STATUS_TTL': 24 * 60 * 60,
+    'PRUNE_ON_STATUS': False,
+    'SHARDS': SHARDS,
+}
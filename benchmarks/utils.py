@@ -0,0 +1,127 @@
+import json
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.core.management import call_command
+    for database in settings.DATABASES:
+        call_command('migrate', database=database, run_syncdb=True,
+                     verbosity=0)
+
+    import benchmarks.celery_app  # noqa
+    from djcelery_model.status import worker_status_cache, \
+        get_worker_status_display, WORKER_READY
+    worker_status_cache.set({
+        'status_code': WORKER_READY,
+        'status': get_worker_status_display(WORKER_READY),
+    })
+
+
+@contextmanager
+def djcelery_model_settings(**options):
+    """
+    Change DJCELERY_MODEL options for one benchmark case. The dict is
+    changed in place, as every djcelery_model module keeps a reference to
+    it.
+    """
+    from django.conf import settings
+    saved = dict(settings.DJCELERY_MODEL)
+    settings.DJCELERY_MODEL.update(options)
+    try:
+        yield
+    finally:
+        settings.DJCELERY_MODEL.clear()
+        settings.DJCELERY_MODEL.update(saved)
+
+
+def count_queries(func):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as context:
+        func()
+    return len(context.captured_queries)
+
+
+def measure(func, repeat=20):
+    """
+    Call ``func`` ``repeat`` times and return timing statistics in
+    milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.time()
+        func()
+        timings.append((time.time() - started) * 1000.0)
+    timings.sort()
+    return {
+        'min_ms': timings[0],
+        'median_ms': timings[len(timings) // 2],
+        'max_ms': timings[-1],
+        'repeat': repeat,
+        'queries': count_queries(func),
+    }
+
+
+def explain(queryset):
+    from django.db import connections
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    if connection.vendor == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN ' + sql
+    else:
+        sql = 'EXPLAIN ' + sql
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [' '.join(str(c) for c in row) for row in cursor.fetchall()]
+
+
+def populate(n_objects, tasks_per_object, seed=0):
+    """
+    Create ``n_objects`` BenchItems with ``tasks_per_object`` task metas
+    each, spread over all task states (and shards).
+    """
+    from django.contrib.contenttypes.models import ContentType
+    from djcelery_model.models import ModelTaskMeta, ModelTaskMetaState
+    from djcelery_model.sharding import get_databases, shard_for_object
+    from benchmarks.benchapp.models import BenchItem
+
+    rnd = random.Random(seed)
+    states = [code for code, _ in ModelTaskMeta.STATES]
+    BenchItem.objects.all().delete()
+    for database in get_databases():
+        ModelTaskMeta.objects.using(database).all().delete()
+    BenchItem.objects.bulk_create(
+        [BenchItem(name='item %d' % i) for i in range(n_objects)],
+        batch_size=500)
+    content_type = ContentType.objects.get_for_model(BenchItem)
+    pks = list(BenchItem.objects.values_list('pk', flat=True))
+    taskmetas = []
+    for pk in pks:
+        for i in range(tasks_per_object):
+            taskmetas.append(ModelTaskMeta(
+                content_type=content_type, object_id=pk,
+                task_id='%d-%d' % (pk, i), task_name='bench',
+                state=rnd.choice(states) if i else ModelTaskMetaState.SUCCESS))
+    by_shard = {}
+    for taskmeta in taskmetas:
+        by_shard.setdefault(shard_for_object(
+            content_type.pk, taskmeta.object_id), []).append(taskmeta)
+    for database, shard_taskmetas in by_shard.items():
+        ModelTaskMeta.objects.using(database).bulk_create(
+            shard_taskmetas, batch_size=500)
+    return pks
+
+
+def emit(record, *streams):
+    line = json.dumps(record, sort_keys=True) + '\n'
+    for stream in streams or (sys.stdout,):
+        stream.write(line)
+        stream.flush()
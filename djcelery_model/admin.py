@@ -1,11 +1,189 @@
+from collections import defaultdict
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.contenttypes.models import ContentType
+
+from .models import ModelTaskMeta, ModelTaskMetaState, \
+    filter_tasks_exist, purge_tasks, tasks_exist
+from .results import forget_task_results
+from .routing import read_database, use_primary
+from .sharding import get_databases, sharding_enabled
+
+
+class TaskStateListFilter(admin.SimpleListFilter):
+    title = 'task status'
+    parameter_name = 'task_status'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('running', 'Running'),
+            ('failed', 'Failed'),
+            ('ready', 'Ready'),
+            ('none', 'No tasks'),
+        )
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value == 'running':
+            return filter_tasks_exist(queryset,
+                                      ModelTaskMetaState.RUNNING_STATES)
+        if value == 'failed':
+            return filter_tasks_exist(queryset, (ModelTaskMetaState.FAILURE,))
+        if value == 'ready':
+            return filter_tasks_exist(queryset,
+                                      ModelTaskMetaState.RUNNING_STATES,
+                                      exists=False)
+        if value == 'none':
+            return filter_tasks_exist(queryset, exists=False)
+        return queryset
+
+
+class ReadDatabaseChangeList(ChangeList):
+    """
+    ChangeList reading the listed objects from
+    DJCELERY_MODEL['READ_DATABASE'].
+    """
+
+    def get_queryset(self, request, *args, **kwargs):
+        queryset = super(ReadDatabaseChangeList, self).get_queryset(
+            request, *args, **kwargs)
+        alias = read_database()
+        if alias is None:
+            return queryset
+        return queryset.using(alias)
 
 
 class TaskModelAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin displaying the task status of TaskMixin objects, with a
+    task status filter and actions to retry, revoke and forget tasks.
+    Listings (but not actions) are read from
+    DJCELERY_MODEL['READ_DATABASE'] if it is set.
+
+    Only the tasks named in ``retry_tasks`` are retried, with the object pk
+    as their only argument; the action is hidden while it is empty.
+    """
+    actions = ['retry_failed_tasks', 'revoke_running_tasks',
+               'forget_ready_tasks']
+    retry_tasks = ()
+
+    def get_queryset(self, request):
+        queryset = super(TaskModelAdmin, self).get_queryset(request)
+        expression = tasks_exist(self.model,
+                                 ModelTaskMetaState.RUNNING_STATES)
+        if expression is None:
+            if sharding_enabled():
+                return queryset
+            return queryset.prefetch_related('tasks')
+        return queryset.annotate(_has_running_tasks=expression)
+
+    def get_changelist(self, request, **kwargs):
+        changelist = super(TaskModelAdmin, self).get_changelist(
+            request, **kwargs)
+        if changelist is ChangeList and request.method in ('GET', 'HEAD'):
+            return ReadDatabaseChangeList
+        return changelist
+
+    def get_actions(self, request):
+        actions = super(TaskModelAdmin, self).get_actions(request)
+        if not self.retry_tasks:
+            actions.pop('retry_failed_tasks', None)
+        return actions
+
+    def response_action(self, request, queryset):
+        # actions write based on what they read
+        with use_primary():
+            return super(TaskModelAdmin, self).response_action(
+                request, queryset)
+
     def get_list_display(self, request):
         return self.list_display + ('task_status',)
 
+    def get_list_filter(self, request):
+        return tuple(self.list_filter) + (TaskStateListFilter,)
+
     def task_status(self, instance):
-        if instance.has_running_tasks:
+        has_running_tasks = getattr(instance, '_has_running_tasks', None)
+        if has_running_tasks is None:
+            has_running_tasks = instance.has_running_tasks
+        if has_running_tasks:
             return "Running"
         return "Ready"
+
+    def get_taskmetas(self, queryset, states, using=None):
+        content_type = ContentType.objects.get_for_model(self.model)
+        object_ids = queryset.values('pk')
+        if using is not None:
+            # shards can not run a subquery on the objects
+            object_ids = list(queryset.values_list('pk', flat=True))
+        return ModelTaskMeta.objects.using(using).filter(
+            content_type=content_type,
+            object_id__in=object_ids,
+            state__in=states)
+
+    def retry_failed_tasks(self, request, queryset):
+        """
+        Queue the failed tasks of the selected objects again, with one
+        apply_async_many() call per task name. Tasks are called with the
+        object pk, like apply_async_many() does by default, so only the
+        tasks listed in ``retry_tasks`` are retried: their original
+        arguments are not stored.
+        """
+        from celery import current_app
+        object_ids = defaultdict(set)
+        for database in get_databases():
+            failed = self.get_taskmetas(
+                queryset, (ModelTaskMetaState.FAILURE,), database)
+            for task_name, object_id in failed.values_list('task_name',
+                                                            'object_id'):
+                object_ids[task_name].add(object_id)
+        count = 0
+        for task_name, ids in object_ids.items():
+            if task_name not in self.retry_tasks:
+                self.message_user(request, "Task %s is not in retry_tasks, "
+                                  "not retried." % task_name)
+                continue
+            task = current_app.tasks.get(task_name)
+            if task is None:
+                self.message_user(request,
+                                  "Unknown task %s, not retried." % task_name)
+                continue
+            count += len(self.model.apply_async_bulk(
+                task, self.model._default_manager.filter(pk__in=ids)))
+        self.message_user(request, "%d task(s) queued again." % count)
+    retry_failed_tasks.short_description = "Retry failed tasks"
+
+    def revoke_running_tasks(self, request, queryset):
+        """
+        Revoke the running tasks of the selected objects with a single
+        broadcast.
+        """
+        from celery import current_app
+        task_ids = []
+        for database in get_databases():
+            task_ids.extend(self.get_taskmetas(
+                queryset, ModelTaskMetaState.RUNNING_STATES,
+                database).values_list('task_id', flat=True))
+        if task_ids:
+            current_app.control.revoke(task_ids)
+        self.message_user(request, "%d task(s) revoked." % len(task_ids))
+    revoke_running_tasks.short_description = "Revoke running tasks"
+
+    def forget_ready_tasks(self, request, queryset):
+        """
+        Remove the ready tasks of the selected objects and their results
+        from the result backend in batches.
+        """
+        count = 0
+        for database in get_databases():
+            taskmetas = list(self.get_taskmetas(
+                queryset, ModelTaskMetaState.READY_STATES,
+                database).values_list('pk', 'task_id'))
+            if taskmetas:
+                forget_task_results([task_id for pk, task_id in taskmetas])
+                purge_tasks([pk for pk, task_id in taskmetas],
+                            using=database)
+            count += len(taskmetas)
+        self.message_user(request, "%d task(s) forgotten." % count)
+    forget_ready_tasks.short_description = "Forget ready tasks"
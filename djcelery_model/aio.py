@@ -0,0 +1,161 @@
+"""
+asyncio counterparts of the TaskMixin status and enqueue API.
+
+Database queries use Django's async ORM where it is available (Django
+>= 4.1) and run in a worker thread otherwise; backend reads that can not be
+batched are run concurrently.
+"""
+import asyncio
+import functools
+import json
+
+from django.http import HttpResponse, HttpResponseNotModified
+from django.views.generic import View
+from django.views.generic.detail import SingleObjectMixin
+
+from .models import DJCELERY_MODEL_SETTINGS, TaskStatusBuilder, \
+    format_task_version, get_task_metas, logger
+from .views import TaskVersionMixin
+
+try:
+    from asgiref.sync import sync_to_async
+except ImportError:
+    sync_to_async = None
+
+
+async def run_sync(func, *args, **kwargs):
+    if sync_to_async is not None:
+        return await sync_to_async(func)(*args, **kwargs)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(func, *args, **kwargs))
+
+
+async def _list(queryset):
+    if hasattr(queryset, '__aiter__'):
+        return [obj async for obj in queryset]
+    return await run_sync(list, queryset)
+
+
+async def _exists(queryset):
+    if hasattr(queryset, 'aexists'):
+        return await queryset.aexists()
+    return await run_sync(queryset.exists)
+
+
+async def aget_task_metas(task_ids, backend=None, failed=None):
+    """
+    Fetch backend metas like get_task_metas(), but look up tasks of
+    backends without batched reads concurrently.
+    """
+    from celery import current_app
+    if backend is None:
+        backend = current_app.backend
+    task_ids = list(set(task_ids))
+    if hasattr(backend, 'mget') or hasattr(backend, 'TaskModel'):
+        return await run_sync(get_task_metas, task_ids, backend, failed)
+
+    async def fetch(task_id):
+        try:
+            return task_id, await run_sync(backend.get_task_meta, task_id)
+        except Exception:
+            return task_id, None
+
+    results = await asyncio.gather(*[fetch(task_id) for task_id in task_ids])
+    if failed is not None:
+        failed.update(task_id for task_id, meta in results if meta is None)
+    return dict((task_id, meta) for task_id, meta in results
+                if meta is not None)
+
+
+async def aget_task_statuses(model, instances, pending_task_timeout=0,
+                             non_block_ui_timeout=0):
+    builder = await run_sync(TaskStatusBuilder, model, instances,
+                             pending_task_timeout, non_block_ui_timeout)
+    # routing and the state store may read the cache or Redis
+    taskmetas = []
+    for queryset in await run_sync(builder.get_querysets):
+        taskmetas.extend(await _list(queryset))
+    await run_sync(builder.add_task_metas, taskmetas)
+    task_ids = builder.get_task_ids()
+    failed = set()
+    try:
+        metas = await aget_task_metas(task_ids, failed=failed)
+    except Exception as e:
+        logger.error("Unable to fetch task states: %s" % e)
+        metas, failed = {}, set(task_ids)
+    return await run_sync(builder.build, metas, failed)
+
+
+async def aread_task_status(instance, pending_task_timeout=0,
+                            non_block_ui_timeout=0):
+    statuses = await aget_task_statuses(instance.__class__, [instance],
+                                        pending_task_timeout,
+                                        non_block_ui_timeout)
+    return statuses[instance.pk]
+
+
+async def aget_task_status(instance, pending_task_timeout=0,
+                           non_block_ui_timeout=0):
+    if DJCELERY_MODEL_SETTINGS.get('PRUNE_ON_STATUS', True):
+        # pruning and reading have to share the thread (and the use_primary()
+        # block) so that the status includes what pruning just wrote
+        return await run_sync(instance.get_task_status, pending_task_timeout,
+                              non_block_ui_timeout)
+    return await aread_task_status(instance, pending_task_timeout,
+                                   non_block_ui_timeout)
+
+
+async def ahas_running_tasks(instance):
+    if instance._prefetched_tasks() is not None:
+        return instance.has_running_tasks
+    if DJCELERY_MODEL_SETTINGS.get('TRACK_SUMMARY', False):
+        return await run_sync(lambda: instance.has_running_tasks)
+    return await _exists(instance.tasks.running())
+
+
+async def ahas_ready_tasks(instance):
+    if instance._prefetched_tasks() is not None:
+        return instance.has_ready_tasks
+    if DJCELERY_MODEL_SETTINGS.get('TRACK_SUMMARY', False):
+        return await run_sync(lambda: instance.has_ready_tasks)
+    return await _exists(instance.tasks.ready())
+
+
+async def aapply_async(instance, task, *args, **kwargs):
+    return await run_sync(instance.apply_async, task, *args, **kwargs)
+
+
+class AsyncModelTaskStatusView(TaskVersionMixin, SingleObjectMixin, View):
+    """
+    Async variant of ModelTaskStatusView for ASGI deployments
+    (Django >= 3.1), with the same ETag and payload cache handling.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await run_sync(self.get_object)
+        version_info = await run_sync(self.object.get_task_version_info)
+        version = format_task_version(version_info)
+        if self.is_not_modified(version):
+            response = HttpResponseNotModified()
+        else:
+            content, version_info = await self.get_content(version,
+                                                           version_info)
+            response = HttpResponse(content,
+                                    content_type="application/json")
+        self.set_version_headers(response, version_info)
+        return response
+
+    async def get_content(self, version, version_info):
+        cached = await run_sync(self.get_cached_content, version)
+        if cached is not None:
+            return cached
+        content = json.dumps(await self.get_response_object())
+        # building the status may have pruned tasks
+        if DJCELERY_MODEL_SETTINGS.get('PRUNE_ON_STATUS', True):
+            version_info = await run_sync(self.object.get_task_version_info)
+        await run_sync(self.cache_content, version, content, version_info)
+        return content, version_info
+
+    async def get_response_object(self):
+        return await aget_task_status(self.object)
@@ -0,0 +1,86 @@
+from datetime import timedelta
+import logging
+import time
+
+from django.utils import timezone
+
+from .instrumentation import instrument
+from .models import ModelTaskMeta, ModelTaskMetaState, purge_tasks
+from .results import forget_task_results
+from .routing import use_primary
+from .sharding import get_databases, shard_of
+
+logger = logging.getLogger('')
+
+
+class CleanupStats(object):
+    def __init__(self):
+        self.rows = 0
+        self.batches = 0
+        self.started = time.time()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started
+
+    @property
+    def throughput(self):
+        return self.rows / max(self.elapsed, 1e-9)
+
+
+@instrument('cleanup')
+@use_primary()
+def cleanup_tasks(queryset=None, states=None, older_than=None,
+                  task_name=None, batch_size=1000, rate=None, forget=True,
+                  dry_run=False, progress=None):
+    """
+    Delete task metas (ready and skipped ones by default) and forget their
+    backend results in batches of ``batch_size`` rows.
+
+    Rows are read batch by batch in primary key order, so the candidate set
+    is never loaded at once. ``older_than`` (seconds) only selects tasks
+    not updated for that long, ``rate`` limits the rows deleted per second
+    and ``progress`` is called with the CleanupStats after every batch.
+    With ``dry_run`` candidates are only counted. Without a ``queryset``
+    every shard is cleaned up, one after another.
+    """
+    if queryset is None:
+        querysets = [ModelTaskMeta.objects.using(database)
+                     for database in get_databases()]
+    else:
+        querysets = [queryset]
+    if states is None:
+        states = ModelTaskMetaState.READY_STATES + \
+            (ModelTaskMetaState.IGNORED,)
+
+    stats = CleanupStats()
+    for queryset in querysets:
+        queryset = queryset.filter(state__in=states)
+        if older_than is not None:
+            queryset = queryset.filter(
+                updated_at__lt=timezone.now() - timedelta(seconds=older_than))
+        if task_name:
+            queryset = queryset.filter(task_name=task_name)
+        using = shard_of(queryset)
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                         .values_list('pk', 'task_id')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            if not dry_run:
+                if forget:
+                    forget_task_results([task_id for _, task_id in batch])
+                purge_tasks([pk for pk, _ in batch], using=using)
+            stats.rows += len(batch)
+            stats.batches += 1
+            if progress is not None:
+                progress(stats)
+            if rate:
+                delay = stats.rows / float(rate) - stats.elapsed
+                if delay > 0:
+                    time.sleep(delay)
+
+    logger.info("%d tasks cleaned up in %.1fs" % (stats.rows, stats.elapsed))
+    return stats
@@ -0,0 +1,124 @@
+from functools import wraps
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import Signal
+
+try:
+    from django.utils.module_loading import import_string
+except ImportError:
+    from django.utils.module_loading import import_by_path as import_string
+
+DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
+
+# Arguments: operation, duration, queries
+operation_finished = Signal()
+
+
+def _get_metrics_backend():
+    backend = DJCELERY_MODEL_SETTINGS.get('METRICS_BACKEND')
+    if backend:
+        return import_string(backend)()
+    return None
+
+
+metrics_backend = _get_metrics_backend()
+_local = threading.local()
+
+
+def enabled():
+    return metrics_backend is not None or \
+        getattr(_local, 'timings', None) is not None or \
+        operation_finished.has_listeners()
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class instrument(object):
+    """
+    Measure an operation of djcelery_model, usable as a context manager or
+    decorator.
+
+    The duration in milliseconds and, on Django versions supporting
+    execute wrappers, the number of database queries are sent to
+    DJCELERY_MODEL['METRICS_BACKEND'] (an object with ``timing(name, value)``
+    and ``incr(name, value=1)`` methods, e.g. a StatsD client) and with the
+    operation_finished signal. Nothing is measured if neither is used.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.active = False
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with instrument(self.operation):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        self.active = enabled()
+        if not self.active:
+            return self
+        self.query_counter = None
+        if hasattr(connection, 'execute_wrapper'):
+            self.query_counter = QueryCounter()
+            self.execute_wrapper = connection.execute_wrapper(
+                self.query_counter)
+            self.execute_wrapper.__enter__()
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.active:
+            return
+        duration = (time.time() - self.started) * 1000.0
+        queries = None
+        if self.query_counter is not None:
+            self.execute_wrapper.__exit__(exc_type, exc_value, traceback)
+            queries = self.query_counter.count
+        record(self.operation, duration, queries, exc_type is not None)
+
+
+def record(operation, duration, queries=None, failed=False):
+    name = 'djcelery_model.%s' % operation
+    if metrics_backend is not None:
+        metrics_backend.timing(name, duration)
+        if queries is not None:
+            metrics_backend.timing('%s.queries' % name, queries)
+        if failed:
+            metrics_backend.incr('%s.errors' % name)
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timing = timings.setdefault(operation, {'calls': 0, 'duration': 0.0})
+        timing['calls'] += 1
+        timing['duration'] += duration
+        if queries is not None:
+            timing['queries'] = timing.get('queries', 0) + queries
+    operation_finished.send(sender=None, operation=operation,
+                            duration=duration, queries=queries)
+
+
+class collect_timings(object):
+    """
+    Collect the timings of all instrumented operations in the current thread
+    into a dict mapping operation names to calls, duration and queries.
+    """
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'timings', None)
+        _local.timings = {}
+        return _local.timings
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.timings = self.previous
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from djcelery_model.cleanup import cleanup_tasks
+from djcelery_model.models import ModelTaskMetaState
+
+
+class Command(BaseCommand):
+    help = 'Delete ready and skipped model tasks and forget their results ' \
+           'in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--state', action='append', dest='states',
+                            choices=sorted(ModelTaskMetaState.CODES),
+                            help='task state to delete (repeatable)')
+        parser.add_argument('--older-than', type=int, default=None,
+                            metavar='SECONDS')
+        parser.add_argument('--task-name', default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--rate', type=float, default=None,
+                            help='maximum number of rows deleted per second')
+        parser.add_argument('--keep-results', action='store_false',
+                            dest='forget', default=True,
+                            help='do not forget backend results')
+        parser.add_argument('--dry-run', action='store_true', default=False)
+
+    def handle(self, *args, **options):
+        states = None
+        if options['states']:
+            states = [ModelTaskMetaState.CODES[name]
+                      for name in options['states']]
+
+        def progress(stats):
+            if options['verbosity'] > 1:
+                self.stdout.write('%d rows, %.1f rows/s' % (
+                    stats.rows, stats.throughput))
+
+        stats = cleanup_tasks(states=states,
+                              older_than=options['older_than'],
+                              task_name=options['task_name'],
+                              batch_size=options['batch_size'],
+                              rate=options['rate'],
+                              forget=options['forget'],
+                              dry_run=options['dry_run'],
+                              progress=progress)
+        self.stdout.write('%s%d rows in %d batches, %.1fs, %.1f rows/s' % (
+            'would delete ' if options['dry_run'] else '',
+            stats.rows, stats.batches, stats.elapsed, stats.throughput))
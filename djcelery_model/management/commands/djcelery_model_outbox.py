@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from djcelery_model.outbox import OutboxRelay
+
+
+class Command(BaseCommand):
+    help = 'Publish the task messages written to the task outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between drains when running '
+                                 'continuously.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the outbox once and exit.')
+
+    def handle(self, *args, **options):
+        relay = OutboxRelay(batch_size=options['batch_size'],
+                            publish_on_commit=False)
+        if options['once']:
+            self.stdout.write('published: %d' % relay.drain())
+            return
+        relay.run(options['interval'])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from djcelery_model.pruning import TaskPruner
+
+
+class Command(BaseCommand):
+    help = 'Remove old, skipped and zombie model tasks and reconcile ' \
+           'running tasks with the result backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pending-task-timeout', type=int, default=0)
+        parser.add_argument('--non-block-ui-timeout', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pruner = TaskPruner(options['pending_task_timeout'],
+                            options['non_block_ui_timeout'],
+                            options['batch_size'])
+        stats = pruner.prune()
+        for key in sorted(stats):
+            self.stdout.write('%s: %d' % (key, stats[key]))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from djcelery_model.models import ModelTaskSummary
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-object task summaries from the task metas.'
+
+    def handle(self, *args, **options):
+        ModelTaskSummary.objects.rebuild()
+        self.stdout.write('%d summaries' % ModelTaskSummary.objects.count())
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from djcelery_model.reconcile import remap_failed_tasks
+
+
+class Command(BaseCommand):
+    help = 'Read the state of FAILURE model tasks stored before their ' \
+           'state was registered from the result backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        remapped = remap_failed_tasks(batch_size=options['batch_size'])
+        self.stdout.write('remapped: %d' % remapped)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from djcelery_model.retention import RetentionEngine, \
+    archive_partitioned, drop_archive_partitions
+
+
+class Command(BaseCommand):
+    help = 'Apply the task retention policies, archiving expired tasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0,
+                            help='seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true', default=False)
+        parser.add_argument('--drop-partitions-older-than', type=int,
+                            default=None, metavar='SECONDS',
+                            help='drop archive partitions older than this')
+
+    def handle(self, *args, **options):
+        engine = RetentionEngine(batch_size=options['batch_size'],
+                                 pause=options['pause'])
+        stats = engine.apply(dry_run=options['dry_run'])
+        for policy in sorted(stats):
+            self.stdout.write('%s: %d' % (policy, stats[policy]))
+        max_age = options['drop_partitions_older_than']
+        if max_age is not None and not options['dry_run'] and \
+                archive_partitioned():
+            for name in drop_archive_partitions(max_age):
+                self.stdout.write('dropped %s' % name)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Partial indexes can not be declared in Meta.indexes before Django 2.2, so
+# this one is created with raw SQL and unknown to the migration state:
+# migrations rebuilding the table on SQLite have to restore it.
+RUNNING_INDEX_NAME = 'djcelery_model_modeltaskmeta_running'
+RUNNING_INDEX_VENDORS = ('postgresql', 'sqlite')
+
+INDEX_TOGETHER = set([
+    ('content_type', 'object_id', 'state'),
+    ('content_type', 'object_id', 'updated_at'),
+])
+# the INDEX_TOGETHER indexes as created on PostgreSQL; Django finds them by
+# their columns, so their names do not have to match its own
+CONCURRENT_INDEXES = (
+    ('djcelery_model_modeltaskmeta_ct_object_state_idx',
+     ('content_type_id', 'object_id', 'state')),
+    ('djcelery_model_modeltaskmeta_ct_object_updated_idx',
+     ('content_type_id', 'object_id', 'updated_at')),
+)
+
+
+def _concurrently(schema_editor):
+    # PostgreSQL builds the indexes without blocking writes to the table,
+    # which is only possible outside of a transaction (atomic = False)
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+def create_indexes(apps, schema_editor):
+    model = apps.get_model('djcelery_model', 'ModelTaskMeta')
+    if not _concurrently(schema_editor):
+        schema_editor.alter_index_together(model, set(), INDEX_TOGETHER)
+        return
+    for name, columns in CONCURRENT_INDEXES:
+        schema_editor.execute('CREATE INDEX CONCURRENTLY %s ON %s (%s)' % (
+            schema_editor.quote_name(name),
+            schema_editor.quote_name(model._meta.db_table),
+            ', '.join(schema_editor.quote_name(c) for c in columns)))
+
+
+def drop_indexes(apps, schema_editor):
+    model = apps.get_model('djcelery_model', 'ModelTaskMeta')
+    if not _concurrently(schema_editor):
+        schema_editor.alter_index_together(model, INDEX_TOGETHER, set())
+        return
+    for name, columns in CONCURRENT_INDEXES:
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' %
+                              schema_editor.quote_name(name))
+
+
+def create_running_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in RUNNING_INDEX_VENDORS:
+        return
+    model = apps.get_model('djcelery_model', 'ModelTaskMeta')
+    schema_editor.execute(
+        'CREATE INDEX %s%s ON %s (content_type_id, object_id) '
+        'WHERE state IN (0, 1, 2)' % (
+            'CONCURRENTLY ' if _concurrently(schema_editor) else '',
+            schema_editor.quote_name(RUNNING_INDEX_NAME),
+            schema_editor.quote_name(model._meta.db_table)))
+
+
+def drop_running_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in RUNNING_INDEX_VENDORS:
+        return
+    schema_editor.execute(
+        'DROP INDEX %sIF EXISTS %s' % (
+            'CONCURRENTLY ' if _concurrently(schema_editor) else '',
+            schema_editor.quote_name(RUNNING_INDEX_NAME)))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('djcelery_model', '0006_auto_20160602_1819'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(create_indexes, drop_indexes),
+            ],
+            state_operations=[
+                migrations.AlterIndexTogether(
+                    name='modeltaskmeta',
+                    index_together=INDEX_TOGETHER,
+                ),
+            ],
+        ),
+        migrations.RunPython(create_running_index, drop_running_index),
+    ]
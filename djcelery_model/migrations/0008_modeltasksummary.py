@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        ('djcelery_model', '0007_modeltaskmeta_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelTaskSummary',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('pending_count', models.IntegerField(default=0)),
+                ('started_count', models.IntegerField(default=0)),
+                ('retry_count', models.IntegerField(default=0)),
+                ('failure_count', models.IntegerField(default=0)),
+                ('success_count', models.IntegerField(default=0)),
+                ('ignored_count', models.IntegerField(default=0)),
+                ('last_ready_task_id', models.CharField(max_length=255, blank=True)),
+                ('last_ready_at', models.DateTimeField(null=True, blank=True)),
+                ('content_type', models.ForeignKey(to='contenttypes.ContentType')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='modeltasksummary',
+            unique_together=set([('content_type', 'object_id')]),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+
+PARTITIONED_TABLE_SQL = '''
+CREATE TABLE %(table)s (
+    id serial NOT NULL,
+    content_type_id integer NOT NULL,
+    object_id integer NOT NULL CHECK (object_id >= 0),
+    task_id varchar(255) NOT NULL,
+    task_name varchar(255) NOT NULL,
+    state integer NOT NULL CHECK (state >= 0),
+    created_at timestamp with time zone NOT NULL,
+    updated_at timestamp with time zone NOT NULL,
+    archived_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, archived_at)
+) PARTITION BY RANGE (archived_at)
+'''
+
+
+def archive_partitioned(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql' and \
+        getattr(settings, 'DJCELERY_MODEL', {}).get(
+            'ARCHIVE_PARTITIONED', False)
+
+
+def partition_archive_table(apps, schema_editor):
+    """
+    Replace the (still empty) archive table with a table partitioned by
+    archived_at on PostgreSQL if DJCELERY_MODEL['ARCHIVE_PARTITIONED'] is set.
+    """
+    if not archive_partitioned(schema_editor):
+        return
+    model = apps.get_model('djcelery_model', 'ModelTaskMetaArchive')
+    table = model._meta.db_table
+    # indexes and constraints of the dropped table are created here instead
+    schema_editor.deferred_sql = [sql for sql in schema_editor.deferred_sql
+                                  if table not in str(sql)]
+    schema_editor.execute('DROP TABLE %s' % schema_editor.quote_name(table))
+    schema_editor.execute(PARTITIONED_TABLE_SQL % {
+        'table': schema_editor.quote_name(table)})
+    for columns in (('task_id',), ('content_type_id', 'object_id')):
+        schema_editor.execute('CREATE INDEX %s ON %s (%s)' % (
+            schema_editor.quote_name('%s_%s' % (table, '_'.join(columns))),
+            schema_editor.quote_name(table),
+            ', '.join(columns)))
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0001_initial'),
+        ('djcelery_model', '0008_modeltasksummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelTaskMetaArchive',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('task_id', models.CharField(max_length=255, db_index=True)),
+                ('task_name', models.CharField(max_length=255, blank=True)),
+                ('state', models.PositiveIntegerField(choices=[(0, b'PENDING'), (1, b'STARTED'), (2, b'RETRY'), (3, b'FAILURE'), (4, b'SUCCESS'), (5, b'IGNORED')])),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('content_type', models.ForeignKey(to='contenttypes.ContentType')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='modeltaskmetaarchive',
+            index_together=set([('content_type', 'object_id')]),
+        ),
+        migrations.RunPython(partition_archive_table, noop),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+RUNNING_INDEX_NAME = 'djcelery_model_modeltaskmeta_running'
+
+
+def restore_running_index(apps, schema_editor):
+    """
+    Re-create the partial index of migration 0007, which SQLite loses when
+    the table is rebuilt to add or remove a column.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    model = apps.get_model('djcelery_model', 'ModelTaskMeta')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS %s ON %s (content_type_id, object_id) '
+        'WHERE state IN (0, 1, 2)' % (
+            schema_editor.quote_name(RUNNING_INDEX_NAME),
+            schema_editor.quote_name(model._meta.db_table)))
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djcelery_model', '0009_modeltaskmetaarchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(noop, restore_running_index),
+        migrations.AddField(
+            model_name='modeltaskmeta',
+            name='dedup_key',
+            field=models.CharField(max_length=40, null=True, blank=True, unique=True),
+        ),
+        migrations.RunPython(restore_running_index, noop),
+    ]
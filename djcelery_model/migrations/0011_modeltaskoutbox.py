@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djcelery_model', '0010_modeltaskmeta_dedup_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModelTaskOutbox',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('task_id', models.CharField(max_length=255, db_index=True)),
+                ('task_name', models.CharField(max_length=255)),
+                ('args', models.TextField(default=b'[]')),
+                ('kwargs', models.TextField(default=b'{}')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+    ]
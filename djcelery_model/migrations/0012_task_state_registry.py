@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+RUNNING_INDEX_NAME = 'djcelery_model_modeltaskmeta_running'
+RUNNING_INDEX_VENDORS = ('postgresql', 'sqlite')
+
+STATE_CHOICES = [(0, b'PENDING'), (1, b'STARTED'), (2, b'RETRY'), (3, b'FAILURE'), (4, b'SUCCESS'), (5, b'IGNORED'), (6, b'REVOKED'), (7, b'RECEIVED'), (8, b'REJECTED')]
+
+FAILURE = 3
+
+
+def replace_running_index(schema_editor, states):
+    if schema_editor.connection.vendor not in RUNNING_INDEX_VENDORS:
+        return
+    table = 'djcelery_model_modeltaskmeta'
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS %s' %
+        schema_editor.quote_name(RUNNING_INDEX_NAME))
+    schema_editor.execute(
+        'CREATE INDEX %s ON %s (content_type_id, object_id) '
+        'WHERE state IN (%s)' % (
+            schema_editor.quote_name(RUNNING_INDEX_NAME),
+            schema_editor.quote_name(table),
+            ', '.join(str(state) for state in states)))
+
+
+def add_received_to_running_index(apps, schema_editor):
+    # the FAILURE rows of states registered here are remapped from the
+    # result backend by the djcelery_model_remap_states command
+    replace_running_index(schema_editor, (0, 1, 2, 7))
+
+
+def restore_failed_tasks(apps, schema_editor):
+    db = schema_editor.connection.alias
+    ModelTaskMeta = apps.get_model('djcelery_model', 'ModelTaskMeta')
+    ModelTaskMeta.objects.using(db).filter(state__gt=5).update(state=FAILURE)
+    replace_running_index(schema_editor, (0, 1, 2))
+
+
+def restore_running_index(apps, schema_editor):
+    # the rebuilds of the table by the reversed operations drop it on SQLite
+    if schema_editor.connection.vendor == 'sqlite':
+        replace_running_index(schema_editor, (0, 1, 2))
+
+
+def noop(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djcelery_model', '0011_modeltaskoutbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(noop, restore_running_index),
+        migrations.AlterField(
+            model_name='modeltaskmeta',
+            name='state',
+            field=models.PositiveIntegerField(default=0, choices=STATE_CHOICES),
+        ),
+        migrations.AlterField(
+            model_name='modeltaskmetaarchive',
+            name='state',
+            field=models.PositiveIntegerField(choices=STATE_CHOICES),
+        ),
+        migrations.AddField(
+            model_name='modeltasksummary',
+            name='revoked_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modeltasksummary',
+            name='received_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='modeltasksummary',
+            name='rejected_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(add_received_to_running_index,
+                             restore_failed_tasks),
+    ]
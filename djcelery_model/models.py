@@ -1,16 +1,31 @@
 # -*- coding: utf-8 -*-
-from django.db import models
-from django.db.models import Q
+import django
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, Max, Q
 from django.db.models.query import QuerySet
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.contrib.contenttypes.models import ContentType
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import islice
 from django.utils import timezone
 from django.conf import settings
-from .status import get_worker_status, get_worker_status_display, \
-    WORKER_BUSY, WORKER_ERROR_STATUSES, WORKER_READY
+from .status import get_cached_worker_status, get_worker_status_display, \
+    worker_status_cache, WORKER_BUSY, WORKER_ERROR_STATUSES, WORKER_READY
 from .exceptions import WorkerError
+from .instrumentation import instrument
+from .pubsub import notify_changed, notify_enabled
+from .results import get_task_metas
+from .routing import pin_objects, read_database, use_primary
+from .sharding import get_databases, get_shard_hint, group_objects, \
+    group_task_ids, shard_for_instance, shard_for_object, shard_hints, \
+    shard_of, shard_options, sharding_enabled
+from .stores import state_store
+import hashlib
+import json
 import logging
+import threading
 
 try:
     # Django >= 1.7
@@ -24,21 +39,99 @@ from celery.result import BaseAsyncResult
 from celery.utils import uuid
 from celery import signals
 
+try:
+    # Django >= 1.11
+    from django.db.models import Exists, OuterRef
+except ImportError:
+    Exists = OuterRef = None
+
+try:
+    from kombu.exceptions import OperationalError as BrokerError
+except ImportError:
+    BrokerError = IOError
+
 logger = logging.getLogger('')
 DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
 
+_local = threading.local()
+
 
 class ModelTaskMetaState(object):
+    """
+    Registry of the task states stored in ModelTaskMeta.state, mapping
+    Celery state names to codes and back and grouping them into running
+    and ready states. Further states (e.g. set with Task.update_state) are
+    added with register() or DJCELERY_MODEL['CUSTOM_STATES'].
+    """
     PENDING = 0
     STARTED = 1
     RETRY = 2
     FAILURE = 3
     SUCCESS = 4
     IGNORED = 5
+    REVOKED = 6
+    RECEIVED = 7
+    REJECTED = 8
+
+    RUNNING = 'running'
+    READY = 'ready'
+
+    RUNNING_STATES = ()
+    READY_STATES = ()
+    CODES = {}
+    NAMES = {}
+
+    @classmethod
+    def register(cls, name, code, kind=None):
+        """
+        Register the Celery state ``name`` with the integer ``code``;
+        ``kind`` is RUNNING, READY or None for states that are neither.
+        """
+        if cls.CODES.get(name, code) != code or \
+                cls.NAMES.get(code, name) != name:
+            raise ImproperlyConfigured(
+                "Task state %s (%s) conflicts with a registered state" % (
+                    name, code))
+        if kind not in (cls.RUNNING, cls.READY, None):
+            raise ImproperlyConfigured(
+                "Unknown kind %r of task state %s" % (kind, name))
+        cls.CODES[name] = code
+        cls.NAMES[code] = name
+        if kind == cls.RUNNING and code not in cls.RUNNING_STATES:
+            cls.RUNNING_STATES += (code,)
+        if kind == cls.READY and code not in cls.READY_STATES:
+            cls.READY_STATES += (code,)
 
     @classmethod
     def lookup(cls, state):
-        return getattr(cls, state, cls.FAILURE)
+        """
+        Return the code of the Celery state ``state``. Unregistered states
+        are custom progress states of running tasks and map to STARTED.
+        """
+        try:
+            return cls.CODES[state]
+        except KeyError:
+            logger.warn("Unknown task state %s, assuming STARTED" % state)
+            return cls.STARTED
+
+    @classmethod
+    def name(cls, code):
+        return cls.NAMES.get(code)
+
+
+for _name, _kind in (('PENDING', ModelTaskMetaState.RUNNING),
+                     ('STARTED', ModelTaskMetaState.RUNNING),
+                     ('RETRY', ModelTaskMetaState.RUNNING),
+                     ('FAILURE', ModelTaskMetaState.READY),
+                     ('SUCCESS', ModelTaskMetaState.READY),
+                     ('IGNORED', None),
+                     ('REVOKED', ModelTaskMetaState.READY),
+                     ('RECEIVED', ModelTaskMetaState.RUNNING),
+                     ('REJECTED', ModelTaskMetaState.READY)):
+    ModelTaskMetaState.register(_name, getattr(ModelTaskMetaState, _name),
+                                _kind)
+for _state in DJCELERY_MODEL_SETTINGS.get('CUSTOM_STATES', ()):
+    ModelTaskMetaState.register(*_state)
 
 
 class ModelTaskMetaFilterMixin(object):
@@ -55,13 +148,13 @@ class ModelTaskMetaFilterMixin(object):
             return None
 
     def pending(self):
-        return self.filter(state=ModelTaskMetaState.PENDING)
+        return state_store.filter_states(self, (ModelTaskMetaState.PENDING,))
 
     def started(self):
-        return self.filter(state=ModelTaskMetaState.STARTED)
+        return state_store.filter_states(self, (ModelTaskMetaState.STARTED,))
 
     def retrying(self):
-        return self.filter(state=ModelTaskMetaState.RETRY)
+        return state_store.filter_states(self, (ModelTaskMetaState.RETRY,))
 
     def failed(self):
         return self.filter(state=ModelTaskMetaState.FAILURE)
@@ -69,14 +162,15 @@ class ModelTaskMetaFilterMixin(object):
     def successful(self):
         return self.filter(state=ModelTaskMetaState.SUCCESS)
 
+    def revoked(self):
+        return self.filter(state=ModelTaskMetaState.REVOKED)
+
     def running(self):
-        return self.filter(Q(state=ModelTaskMetaState.PENDING) |
-                           Q(state=ModelTaskMetaState.STARTED) |
-                           Q(state=ModelTaskMetaState.RETRY))
+        return state_store.filter_states(self,
+                                         ModelTaskMetaState.RUNNING_STATES)
 
     def ready(self):
-        return self.filter(Q(state=ModelTaskMetaState.FAILURE) |
-                           Q(state=ModelTaskMetaState.SUCCESS))
+        return self.filter(state__in=ModelTaskMetaState.READY_STATES)
 
     def skipped(self):
         return self.filter(state=ModelTaskMetaState.IGNORED)
@@ -94,6 +188,7 @@ class ModelTaskMetaManager(ModelTaskMetaFilterMixin, models.Manager):
 
 
 class ModelTaskMeta(models.Model):
+    # custom states are left out, so that they need no migrations
     STATES = (
         (ModelTaskMetaState.PENDING, 'PENDING'),
         (ModelTaskMetaState.STARTED, 'STARTED'),
@@ -101,6 +196,9 @@ class ModelTaskMeta(models.Model):
         (ModelTaskMetaState.FAILURE, 'FAILURE'),
         (ModelTaskMetaState.SUCCESS, 'SUCCESS'),
         (ModelTaskMetaState.IGNORED, 'IGNORED'),
+        (ModelTaskMetaState.REVOKED, 'REVOKED'),
+        (ModelTaskMetaState.RECEIVED, 'RECEIVED'),
+        (ModelTaskMetaState.REJECTED, 'REJECTED'),
     )
 
     content_type = models.ForeignKey(ContentType)
@@ -113,83 +211,491 @@ class ModelTaskMeta(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     block_ui = models.BooleanField(default=False)
+    dedup_key = models.CharField(max_length=40, null=True, blank=True,
+                                 unique=True)
+    progress = models.PositiveSmallIntegerField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
     objects = ModelTaskMetaManager()
 
+    class Meta:
+        index_together = (
+            ('content_type', 'object_id', 'state'),
+            ('content_type', 'object_id', 'updated_at'),
+        )
+
     def __unicode__(self):
-        return u'%s: %s' % (self.task_id, dict(self.STATES)[self.state])
+        return u'%s: %s' % (self.task_id, self.get_state_display())
+
+    def get_state_display(self):
+        return ModelTaskMetaState.name(self.state)
 
     @property
     def result(self):
         return ModelAsyncResult(self.task_id)
 
+    def is_alive(self, deadline=None):
+        """
+        Return whether the task reported progress or a heartbeat within
+        DJCELERY_MODEL['HEARTBEAT_TIMEOUT'] seconds (or since ``deadline``).
+        """
+        if deadline is None:
+            deadline = get_heartbeat_deadline()
+        return self.heartbeat_at is not None and deadline is not None and \
+            self.heartbeat_at >= deadline
+
 
 class ModelAsyncResult(BaseAsyncResult):
     def forget(self):
-        ModelTaskMeta.objects.filter(task_id=self.id).delete()
+        delete_task(self.id)
         return super(ModelAsyncResult, self).forget()
 
 
+class ModelTaskSummaryManager(models.Manager):
+    STATE_FIELDS = {
+        ModelTaskMetaState.PENDING: 'pending_count',
+        ModelTaskMetaState.STARTED: 'started_count',
+        ModelTaskMetaState.RETRY: 'retry_count',
+        ModelTaskMetaState.FAILURE: 'failure_count',
+        ModelTaskMetaState.SUCCESS: 'success_count',
+        ModelTaskMetaState.IGNORED: 'ignored_count',
+        ModelTaskMetaState.REVOKED: 'revoked_count',
+        ModelTaskMetaState.RECEIVED: 'received_count',
+        ModelTaskMetaState.REJECTED: 'rejected_count',
+    }
+
+    def enabled(self):
+        return DJCELERY_MODEL_SETTINGS.get('TRACK_SUMMARY', False)
+
+    def supports(self, states):
+        """
+        Return whether all ``states`` are counted; custom states are not.
+        """
+        return all(state in self.STATE_FIELDS for state in states)
+
+    def states_q(self, states):
+        q = Q()
+        for state in states:
+            q |= Q(**{'%s__gt' % self.STATE_FIELDS[state]: 0})
+        return q
+
+    def record_transition(self, content_type_id, object_id, old_state,
+                          new_state, task_id=None, updated_at=None):
+        """
+        Move one task of an object from ``old_state`` to ``new_state``.
+        Either state may be None for created or deleted tasks.
+        """
+        updates = {}
+        if old_state in self.STATE_FIELDS:
+            field = self.STATE_FIELDS[old_state]
+            updates[field] = F(field) - 1
+        if new_state in self.STATE_FIELDS:
+            field = self.STATE_FIELDS[new_state]
+            if field in updates:
+                del updates[field]
+            else:
+                updates[field] = F(field) + 1
+        if new_state in ModelTaskMetaState.READY_STATES and task_id:
+            updates['last_ready_task_id'] = task_id
+            updates['last_ready_at'] = updated_at or timezone.now()
+        if not updates:
+            return
+        queryset = self.filter(content_type_id=content_type_id,
+                               object_id=object_id)
+        if not queryset.update(**updates):
+            try:
+                with transaction.atomic():
+                    self.create(content_type_id=content_type_id,
+                                object_id=object_id)
+            except IntegrityError:
+                pass
+            queryset.update(**updates)
+
+    def record_created(self, content_type_id, object_ids):
+        """
+        Count one new pending task for every object id, with one UPDATE per
+        distinct number of new tasks per object.
+        """
+        counts = Counter(object_ids)
+        existing = set(self.filter(
+            content_type_id=content_type_id, object_id__in=list(counts),
+        ).values_list('object_id', flat=True))
+        self.bulk_create([
+            self.model(content_type_id=content_type_id, object_id=object_id)
+            for object_id in counts if object_id not in existing])
+        by_count = {}
+        for object_id, count in counts.items():
+            by_count.setdefault(count, []).append(object_id)
+        for count, ids in by_count.items():
+            self.filter(content_type_id=content_type_id,
+                        object_id__in=ids).update(
+                pending_count=F('pending_count') + count)
+
+    @use_primary()
+    def rebuild(self, pairs=None):
+        """
+        Recompute the summaries of the given ``(content_type_id,
+        object_id)`` pairs, or of all objects, from the task metas.
+        """
+        if pairs is None:
+            pairs = set()
+            for database in get_databases():
+                pairs.update(ModelTaskMeta.objects.using(database).values_list(
+                    'content_type', 'object_id').distinct())
+            pairs.update(self.values_list('content_type', 'object_id'))
+        objects_by_type = {}
+        for content_type_id, object_id in pairs:
+            objects_by_type.setdefault(content_type_id, set()).add(object_id)
+
+        for content_type_id, object_ids in objects_by_type.items():
+            object_ids = list(object_ids)
+            fields = dict((object_id, dict(
+                (field, 0) for field in self.STATE_FIELDS.values()))
+                for object_id in object_ids)
+            for database, shard_object_ids in group_objects(
+                    content_type_id, object_ids).items():
+                taskmetas = ModelTaskMeta.objects.using(database).filter(
+                    content_type_id=content_type_id,
+                    object_id__in=shard_object_ids)
+                for object_id, state, count in taskmetas.values_list(
+                        'object_id', 'state').annotate(
+                            n=Count('pk')).order_by():
+                    if state in self.STATE_FIELDS:
+                        fields[object_id][self.STATE_FIELDS[state]] = count
+                last_ready_tasks = taskmetas.ready().order_by(
+                    'object_id', '-updated_at', '-created_at',
+                ).values_list('object_id', 'task_id', 'updated_at')
+                for object_id, task_id, updated_at in last_ready_tasks:
+                    if 'last_ready_task_id' not in fields[object_id]:
+                        fields[object_id]['last_ready_task_id'] = task_id
+                        fields[object_id]['last_ready_at'] = updated_at
+
+            existing = set(self.filter(
+                content_type_id=content_type_id, object_id__in=object_ids,
+            ).values_list('object_id', flat=True))
+            new_summaries = []
+            for object_id, values in fields.items():
+                values.setdefault('last_ready_task_id', '')
+                values.setdefault('last_ready_at', None)
+                if object_id in existing:
+                    self.filter(content_type_id=content_type_id,
+                                object_id=object_id).update(**values)
+                else:
+                    new_summaries.append(self.model(
+                        content_type_id=content_type_id,
+                        object_id=object_id, **values))
+            self.bulk_create(new_summaries)
+
+
+class ModelTaskSummary(models.Model):
+    """
+    Per-object task counters, maintained when DJCELERY_MODEL['TRACK_SUMMARY']
+    is enabled so that task filters do not have to scan ModelTaskMeta.
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey()
+    pending_count = models.IntegerField(default=0)
+    started_count = models.IntegerField(default=0)
+    retry_count = models.IntegerField(default=0)
+    failure_count = models.IntegerField(default=0)
+    success_count = models.IntegerField(default=0)
+    ignored_count = models.IntegerField(default=0)
+    revoked_count = models.IntegerField(default=0)
+    received_count = models.IntegerField(default=0)
+    rejected_count = models.IntegerField(default=0)
+    last_ready_task_id = models.CharField(max_length=255, blank=True)
+    last_ready_at = models.DateTimeField(null=True, blank=True)
+    objects = ModelTaskSummaryManager()
+
+    class Meta:
+        unique_together = (('content_type', 'object_id'),)
+
+    def __unicode__(self):
+        return u'%s.%s: %d running, %d ready' % (
+            self.content_type_id, self.object_id,
+            self.running_count, self.ready_count)
+
+    @property
+    def running_count(self):
+        return self.pending_count + self.started_count + \
+            self.retry_count + self.received_count
+
+    @property
+    def ready_count(self):
+        return self.failure_count + self.success_count + \
+            self.revoked_count + self.rejected_count
+
+
+class ModelTaskMetaArchive(models.Model):
+    """
+    Ready task metas moved out of ModelTaskMeta by the retention engine.
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    content_object = GenericForeignKey()
+    task_id = models.CharField(max_length=255, db_index=True)
+    task_name = models.CharField(max_length=255, blank=True)
+    state = models.PositiveIntegerField(choices=ModelTaskMeta.STATES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = (('content_type', 'object_id'),)
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.task_id,
+                            ModelTaskMetaState.name(self.state))
+
+    @classmethod
+    def from_task_meta(cls, taskmeta):
+        return cls(content_type_id=taskmeta.content_type_id,
+                   object_id=taskmeta.object_id,
+                   task_id=taskmeta.task_id,
+                   task_name=taskmeta.task_name,
+                   state=taskmeta.state,
+                   created_at=taskmeta.created_at,
+                   updated_at=taskmeta.updated_at)
+
+
+class ModelTaskOutbox(models.Model):
+    """
+    Task messages written by TaskMixin.apply_async in outbox mode, in the
+    same transaction as their task meta, and published by the OutboxRelay.
+    """
+    task_id = models.CharField(max_length=255, db_index=True)
+    task_name = models.CharField(max_length=255)
+    args = models.TextField(default='[]')
+    kwargs = models.TextField(default='{}')
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    def __unicode__(self):
+        return u'%s: %s' % (self.task_id, self.task_name)
+
+    def get_args(self):
+        return json.loads(self.args)
+
+    def get_kwargs(self):
+        return json.loads(self.kwargs)
+
+
 class TaskFilterMixin(object):
+    def _summary_object_ids(self, states):
+        if states is None:
+            states = ModelTaskSummary.objects.STATE_FIELDS.keys()
+        content_type = ContentType.objects.get_for_model(self.model)
+        return ModelTaskSummary.objects.filter(
+            ModelTaskSummary.objects.states_q(states),
+            content_type=content_type,
+        ).values('object_id')
+
+    def _use_summary(self, states):
+        if not ModelTaskSummary.objects.enabled():
+            return False
+        if not ModelTaskSummary.objects.supports(
+                ModelTaskMetaState.NAMES if states is None else states):
+            return False
+        # running states kept outside the table are not counted separately
+        return not state_store.overlay or states is None or \
+            set(states) & set(ModelTaskMetaState.RUNNING_STATES) in (
+                set(), set(ModelTaskMetaState.RUNNING_STATES))
+
+    def _on_read_database(self, queryset):
+        alias = read_database()
+        if alias is None or not hasattr(queryset, 'read_from'):
+            return queryset
+        return queryset.read_from(alias)
+
+    def _with_tasks_in(self, states=None):
+        if self._use_summary(states):
+            return self._on_read_database(
+                self.filter(pk__in=self._summary_object_ids(states)))
+        return self._on_read_database(filter_tasks_exist(self, states))
+
+    def _without_tasks_in(self, states=None):
+        if self._use_summary(states):
+            return self._on_read_database(
+                self.exclude(pk__in=self._summary_object_ids(states)))
+        return self._on_read_database(
+            filter_tasks_exist(self, states, exists=False))
+
     def with_tasks(self):
-        return self.filter(tasks__state__isnull=False)
+        return self._with_tasks_in()
 
     def with_pending_tasks(self):
-        return self.filter(tasks__state=ModelTaskMetaState.PENDING)
+        return self._with_tasks_in((ModelTaskMetaState.PENDING,))
 
     def with_started_tasks(self):
-        return self.filter(tasks__state=ModelTaskMetaState.STARTED)
+        return self._with_tasks_in((ModelTaskMetaState.STARTED,))
 
     def with_retrying_tasks(self):
-        return self.filter(tasks__state=ModelTaskMetaState.RETRY)
+        return self._with_tasks_in((ModelTaskMetaState.RETRY,))
 
     def with_failed_tasks(self):
-        return self.filter(tasks__state=ModelTaskMetaState.FAILURE)
+        return self._with_tasks_in((ModelTaskMetaState.FAILURE,))
 
     def with_successful_tasks(self):
-        return self.filter(tasks__state=ModelTaskMetaState.SUCCESS)
+        return self._with_tasks_in((ModelTaskMetaState.SUCCESS,))
 
     def with_running_tasks(self):
-        return self.filter(Q(tasks__state=ModelTaskMetaState.PENDING) |
-                           Q(tasks__state=ModelTaskMetaState.STARTED) |
-                           Q(tasks__state=ModelTaskMetaState.RETRY))
+        return self._with_tasks_in(ModelTaskMetaState.RUNNING_STATES)
 
     def with_ready_tasks(self):
-        return self.filter(Q(tasks__state=ModelTaskMetaState.FAILURE) |
-                           Q(tasks__state=ModelTaskMetaState.SUCCESS))
+        return self._with_tasks_in(ModelTaskMetaState.READY_STATES)
 
     def without_tasks(self):
-        return self.exclude(tasks__state__isnull=False)
+        return self._without_tasks_in()
 
     def without_pending_tasks(self):
-        return self.exclude(tasks__state=ModelTaskMetaState.PENDING)
+        return self._without_tasks_in((ModelTaskMetaState.PENDING,))
 
     def without_started_tasks(self):
-        return self.exclude(tasks__state=ModelTaskMetaState.STARTED)
+        return self._without_tasks_in((ModelTaskMetaState.STARTED,))
 
     def without_retrying_tasks(self):
-        return self.exclude(tasks__state=ModelTaskMetaState.RETRY)
+        return self._without_tasks_in((ModelTaskMetaState.RETRY,))
 
     def without_failed_tasks(self):
-        return self.exclude(tasks__state=ModelTaskMetaState.FAILURE)
+        return self._without_tasks_in((ModelTaskMetaState.FAILURE,))
 
     def without_successful_tasks(self):
-        return self.exclude(tasks__state=ModelTaskMetaState.SUCCESS)
+        return self._without_tasks_in((ModelTaskMetaState.SUCCESS,))
 
     def without_running_tasks(self):
-        return self.exclude(Q(tasks__state=ModelTaskMetaState.PENDING) |
-                            Q(tasks__state=ModelTaskMetaState.STARTED) |
-                            Q(tasks__state=ModelTaskMetaState.RETRY))
+        return self._without_tasks_in(ModelTaskMetaState.RUNNING_STATES)
 
     def without_ready_tasks(self):
-        return self.exclude(Q(tasks__state=ModelTaskMetaState.FAILURE) |
-                            Q(tasks__state=ModelTaskMetaState.SUCCESS))
-
+        return self._without_tasks_in(ModelTaskMetaState.READY_STATES)
+
+
+class TaskBatchMixin(object):
+    def with_task_summary(self):
+        """
+        Prefetch the tasks of all objects with one query, so that
+        has_running_tasks, has_ready_tasks, last_ready_task,
+        current_running_tasks and read_task_status() do not query per object.
+        Sharded task metas can not be prefetched and are read per object.
+        """
+        if sharding_enabled():
+            return self.all()
+        return self.prefetch_related('tasks')
+
+    @instrument('apply_async_many')
+    @use_primary()
+    def apply_async_many(self, task, instances=None, arguments=None,
+                         block_ui=False, batch_size=500, **options):
+        """
+        Queue ``task`` once for every instance (defaults to all objects of
+        this manager or queryset) and return the list of async results.
+
+        ``arguments`` is a callable returning ``(args, kwargs)`` for an
+        instance; by default the task is called with the instance pk.
+        Task metas are created with one INSERT per batch (and shard) and
+        every message is published through the same producer connection,
+        without writing the PENDING state they were created with again.
+        """
+        check_worker_status()
+        if instances is None:
+            instances = self.all()
+        if isinstance(instances, QuerySet):
+            instances = instances.iterator()
+        if arguments is None:
+            arguments = lambda instance: ((instance.pk,), {})
+        content_type = ContentType.objects.get_for_model(self.model)
+
+        results = []
+        with task.app.producer_or_acquire() as producer:
+            for batch in _chunked(instances, batch_size):
+                taskmetas = [ModelTaskMeta(task_id=uuid(),
+                                           content_type=content_type,
+                                           object_id=instance.pk,
+                                           block_ui=block_ui,
+                                           task_name=task.name)
+                             for instance in batch]
+                by_shard = {}
+                for taskmeta in taskmetas:
+                    by_shard.setdefault(shard_for_object(
+                        content_type.pk, taskmeta.object_id), []).append(
+                            taskmeta)
+                for database, shard_taskmetas in by_shard.items():
+                    ModelTaskMeta.objects.using(database).bulk_create(
+                        shard_taskmetas)
+                if ModelTaskSummary.objects.enabled():
+                    ModelTaskSummary.objects.record_created(
+                        content_type.pk, [t.object_id for t in taskmetas])
+                if notify_enabled():
+                    notify_changed((content_type.pk, t.object_id)
+                                   for t in taskmetas)
+                pin_objects((content_type.pk, t.object_id)
+                            for t in taskmetas)
+                with created_pending([t.task_id for t in taskmetas]):
+                    for instance, taskmeta in zip(batch, taskmetas):
+                        args, kwargs = arguments(instance)
+                        task_options = shard_options(
+                            taskmeta.task_id, shard_for_object(
+                                content_type.pk, taskmeta.object_id),
+                            options)
+                        try:
+                            results.append(task.apply_async(
+                                args=args, kwargs=kwargs,
+                                task_id=taskmeta.task_id, producer=producer,
+                                **task_options))
+                        except (IOError, BrokerError) as e:
+                            worker_status_cache.mark_offline(
+                                "Error publishing task: %s" % e)
+                            raise
+        return results
+
+
+    def get_task_statuses(self, instances=None, pending_task_timeout=0,
+                          non_block_ui_timeout=0):
+        """
+        Build the get_task_status() dict of many instances at once and
+        return them keyed by instance pk. See build_task_statuses().
+        """
+        if instances is None:
+            instances = self.all()
+        return build_task_statuses(self.model, instances,
+                                   pending_task_timeout,
+                                   non_block_ui_timeout)
+
+    def aget_task_statuses(self, instances, pending_task_timeout=0,
+                           non_block_ui_timeout=0):
+        from .aio import aget_task_statuses
+        return aget_task_statuses(self.model, instances,
+                                  pending_task_timeout,
+                                  non_block_ui_timeout)
+
+
+class TaskQuerySet(TaskFilterMixin, TaskBatchMixin, QuerySet):
+    _read_db = None
 
-class TaskQuerySet(TaskFilterMixin, QuerySet):
-    pass
-
-
-class TaskManager(TaskFilterMixin, models.Manager):
+    @property
+    def db(self):
+        if self._read_db is not None and self._db is None and \
+                not self._for_write:
+            return self._read_db
+        return super(TaskQuerySet, self).db
+
+    def read_from(self, alias):
+        """
+        Read from the database ``alias`` (e.g. a replica), while writes like
+        update() and delete() still go to the database chosen by the
+        routers.
+        """
+        clone = self._clone()
+        clone._read_db = alias
+        return clone
+
+    def _clone(self, *args, **kwargs):
+        clone = super(TaskQuerySet, self)._clone(*args, **kwargs)
+        clone._read_db = self._read_db
+        return clone
+
+
+class TaskManager(TaskFilterMixin, TaskBatchMixin, models.Manager):
     use_for_related_fields = True
 
     def get_queryset(self):
@@ -198,201 +704,832 @@ class TaskManager(TaskFilterMixin, models.Manager):
 
 class TaskMixin(models.Model):
     tasks = GenericRelation(ModelTaskMeta)
+    task_summaries = GenericRelation(ModelTaskSummary)
 
     objects = TaskManager()
 
     class Meta:
         abstract = True
 
+    def _prefetched_tasks(self):
+        cache = getattr(self, '_prefetched_objects_cache', None)
+        if not cache or 'tasks' not in cache:
+            return None
+        return sorted(cache['tasks'], reverse=True,
+                      key=lambda t: (t.updated_at, t.created_at))
+
     @property
     def has_running_tasks(self):
+        tasks = self._prefetched_tasks()
+        if tasks is not None:
+            return any(t.state in ModelTaskMetaState.RUNNING_STATES
+                       for t in tasks)
+        if ModelTaskSummary.objects.enabled() and \
+                ModelTaskSummary.objects.supports(
+                    ModelTaskMetaState.RUNNING_STATES):
+            return self._has_summary_tasks(ModelTaskMetaState.RUNNING_STATES)
         return self.tasks.running().exists()
 
     @property
     def has_ready_tasks(self):
+        tasks = self._prefetched_tasks()
+        if tasks is not None:
+            return any(t.state in ModelTaskMetaState.READY_STATES
+                       for t in tasks)
+        if ModelTaskSummary.objects.enabled() and \
+                ModelTaskSummary.objects.supports(
+                    ModelTaskMetaState.READY_STATES):
+            return self._has_summary_tasks(ModelTaskMetaState.READY_STATES)
         return self.tasks.ready().exists()
 
+    def _has_summary_tasks(self, states):
+        return self.task_summaries.filter(
+            ModelTaskSummary.objects.states_q(states)).exists()
+
     @property
     def last_ready_task(self):
+        tasks = self._prefetched_tasks()
+        if tasks is not None:
+            for t in tasks:
+                if t.state in ModelTaskMetaState.READY_STATES:
+                    return t
+            return None
         return self.tasks.last_ready_task()
 
     @property
     def current_running_tasks(self):
+        tasks = self._prefetched_tasks()
+        if tasks is not None:
+            return [t for t in tasks
+                    if t.state in ModelTaskMetaState.RUNNING_STATES]
         return self.tasks.current_running_tasks()
 
+    def get_task_version(self, pending_task_timeout=0,
+                         non_block_ui_timeout=0):
+        """
+        Return a cheap key that changes whenever a task of this object is
+        created, updated or deleted, or a running task passes one of the
+        timeouts changing its status.
+        """
+        return format_task_version(self.get_task_version_info(
+            pending_task_timeout, non_block_ui_timeout))
+
+    def get_task_version_info(self, pending_task_timeout=0,
+                              non_block_ui_timeout=0):
+        version_info = self.tasks.aggregate(count=Count('pk'),
+                                            updated_at=Max('updated_at'))
+        if not version_info['count']:
+            return version_info
+        running = list(self.tasks.running().values_list(
+            'task_id', 'state', 'created_at', 'heartbeat_at'))
+        states = {}
+        if state_store.overlay:
+            states = state_store.get_states([row[0] for row in running])
+            version_info['states'] = sorted(states.items())
+        version_info['timed_out'] = count_timed_out_tasks(
+            [(states.get(task_id, state), created_at, heartbeat_at)
+             for task_id, state, created_at, heartbeat_at in running],
+            pending_task_timeout, non_block_ui_timeout)
+        return version_info
+
+    @instrument('get_task_status')
     def get_task_status(self, pending_task_timeout=0,
                         non_block_ui_timeout=0):
-        status_obj = {
-
-        }
-
-        if pending_task_timeout <= 0:
-            pending_task_timeout = DJCELERY_MODEL_SETTINGS.get(
-                'PENDING_TASK_TIMEOUT', 10 * 60)
-        if non_block_ui_timeout <= 0:
-            non_block_ui_timeout = DJCELERY_MODEL_SETTINGS.get(
-                'NON_BLOCK_UI_TIMEOUT', 1 * 60)
-
-        last_ready_task = self.last_ready_task
-
-        # remove old NOT RUNNING tasks
-        old_ready_tasks = self.tasks.ready()
-        if last_ready_task:
-            old_ready_tasks = old_ready_tasks.exclude(pk=last_ready_task.pk)
-        res = old_ready_tasks.delete()
-        removed_n = 0
-        rn = 0
-        if res is not None and len(res) == 2:
-            rn, _ = res
-
-        res = self.tasks.skipped().delete()
-        if res is not None and len(res) == 2:
-            removed_n, _ = res
-        removed_n += rn
-        if removed_n > 0:
-            logger.info("%d old tasks removed for %s" % (removed_n, self))
-
-        # remove zombie tasks
-        for t in self.tasks.running():
-            timediff = datetime.utcnow().replace(tzinfo=timezone.utc) - \
-                       t.created_at
-            res = ModelAsyncResult(t.task_id)
-            try:
-                res_state = res.state
-            except Exception as e:
-                res.forget()
-                logger.error("Task %s: wrong state, forget: %s" % (t, e))
-                continue
-            res_state = ModelTaskMetaState.lookup(res_state)
-            if t.state != res_state:
-                t.state = res_state
-                t.save()
-                logger.warn("Task %s state changed (mismatch)" % t)
-            elapsed = timediff.total_seconds()
-            if elapsed > pending_task_timeout and \
-                    (t.state == ModelTaskMetaState.PENDING):
-                t.delete()
-                logger.warn(
-                    "Task %s removed: pending for %s" % (t, elapsed))
-                continue
-            if not t.block_ui and t.state == ModelTaskMetaState.STARTED \
-                    and elapsed > non_block_ui_timeout:
-                t.block_ui = True
-                t.save()
-                logger.warn(
-                    "Task %s removed: pending for %s" % (t, elapsed))
-
-        if self.has_running_tasks:
-            status_obj['running_tasks'] = []
-            status = get_worker_status_display(WORKER_BUSY)
-            current_tasks = self.current_running_tasks
-            for current_task in current_tasks:
-                running_time = datetime.utcnow().replace(tzinfo=timezone.utc) \
-                               - current_task.created_at
-                status_obj['running_tasks'].append({
-                    'task_id': current_task.task_id,
-                    'task_name': current_task.task_name,
-                    'state': current_task.get_state_display(),
-                    'block_ui': current_task.block_ui,
-                    'created_at': str(current_task.created_at),
-                    'execution_time': running_time.total_seconds(),
-                })
-        else:
-            # worker_status = get_worker_status()
-            # status = worker_status['status']
-            # status_obj.update(worker_status)
-            status = get_worker_status_display(WORKER_READY)
-
-        status_obj['status'] = status
-        if last_ready_task:
-            last_task_result = last_ready_task.result.result
-            execution_time = last_ready_task.updated_at - last_ready_task.created_at
-
-            status_obj['last_ready_task'] = {
-                'task_id': last_ready_task.task_id,
-                'task_name': last_ready_task.task_name,
-                'state': last_ready_task.get_state_display(),
-                'created_at': str(last_ready_task.created_at),
-                'updated_at': str(last_ready_task.updated_at),
-            }
-            status_obj['last_ready_task']['execution_time'] = \
-                execution_time.total_seconds()
-
-            if isinstance(last_task_result, Exception):
-                status_obj['last_ready_task']['error_message'] = str(
-                    last_task_result)
-            else:
-                status_obj['last_ready_task']['result'] = last_task_result
-
-        return status_obj
-
+        if DJCELERY_MODEL_SETTINGS.get('PRUNE_ON_STATUS', True):
+            # the status has to include what pruning just wrote
+            with use_primary():
+                self.prune_tasks(pending_task_timeout, non_block_ui_timeout)
+                return self.read_task_status(pending_task_timeout,
+                                             non_block_ui_timeout)
+        return self.read_task_status(pending_task_timeout,
+                                     non_block_ui_timeout)
+
+    @instrument('read_task_status')
+    def read_task_status(self, pending_task_timeout=0,
+                         non_block_ui_timeout=0):
+        return build_task_statuses(self.__class__, [self],
+                                   pending_task_timeout,
+                                   non_block_ui_timeout)[self.pk]
+
+    def aget_task_status(self, pending_task_timeout=0,
+                         non_block_ui_timeout=0):
+        from .aio import aget_task_status
+        return aget_task_status(self, pending_task_timeout,
+                                non_block_ui_timeout)
+
+    def aread_task_status(self, pending_task_timeout=0,
+                          non_block_ui_timeout=0):
+        from .aio import aread_task_status
+        return aread_task_status(self, pending_task_timeout,
+                                 non_block_ui_timeout)
+
+    def ahas_running_tasks(self):
+        from .aio import ahas_running_tasks
+        return ahas_running_tasks(self)
+
+    def ahas_ready_tasks(self):
+        from .aio import ahas_ready_tasks
+        return ahas_ready_tasks(self)
+
+    def aapply_async(self, task, *args, **kwargs):
+        from .aio import aapply_async
+        return aapply_async(self, task, *args, **kwargs)
+
+    def prune_tasks(self, pending_task_timeout=0, non_block_ui_timeout=0):
+        from .pruning import TaskPruner
+        pruner = TaskPruner(pending_task_timeout, non_block_ui_timeout)
+        return pruner.prune(self.tasks.all())
+
+    @instrument('apply_async')
+    @use_primary()
     def apply_async(self, task, *args, **kwargs):
-        status = get_worker_status()
-        if status['status_code'] in WORKER_ERROR_STATUSES:
-            raise WorkerError("Worker status is '%s'. %s" % (
-                status['status'], status.get('status_message', '')
-            ))
+        """
+        Queue ``task`` for this instance. With ``dedup=True`` (or
+        DJCELERY_MODEL['DEDUP_TASKS']) no new task is published while
+        another ``task`` of this instance is running; its result is returned
+        instead. ``dedup='args'`` only treats tasks with the same arguments
+        as duplicates.
+
+        With ``outbox=True`` (or DJCELERY_MODEL['OUTBOX']) the message is
+        written to ModelTaskOutbox in the same transaction as the task meta
+        and published after commit by the OutboxRelay, so that the task is
+        never published for a rolled back transaction and the caller never
+        waits for the broker. Arguments must be JSON serializable.
+
+        If DJCELERY_MODEL['READ_DATABASE'] is set, reads of the tasks of
+        this instance go to the primary database for
+        DJCELERY_MODEL['READ_PIN_TIMEOUT'] seconds afterwards.
+
+        If DJCELERY_MODEL['SHARDS'] is set, the task meta is written to the
+        shard of this instance, which is named in the task headers.
+        """
+        dedup = kwargs.pop('dedup',
+                           DJCELERY_MODEL_SETTINGS.get('DEDUP_TASKS', False))
+        outbox = kwargs.pop('outbox',
+                            DJCELERY_MODEL_SETTINGS.get('OUTBOX', False))
+        database = shard_for_instance(self)
+        if outbox and database is not None:
+            raise ImproperlyConfigured(
+                "The task outbox does not support sharded task metas")
+        if not outbox:
+            check_worker_status()
         if 'task_id' in kwargs:
             task_id = kwargs['task_id']
         else:
             task_id = uuid()
         block_ui = kwargs.get('block_ui', False)
+        with transaction.atomic(using=database):
+            taskmeta, previous, existing = self._save_task_meta(
+                task, task_id, block_ui, dedup, args, kwargs, database)
+            if existing is not None:
+                return ModelAsyncResult(existing.task_id)
+            if outbox:
+                entry = ModelTaskOutbox.objects.create(
+                    task_id=task_id, task_name=task.name,
+                    args=json.dumps(list(args)), kwargs=json.dumps(kwargs))
+        if ModelTaskSummary.objects.enabled():
+            if previous is None:
+                ModelTaskSummary.objects.record_transition(
+                    taskmeta.content_type_id, taskmeta.object_id,
+                    None, taskmeta.state)
+            else:
+                ModelTaskSummary.objects.rebuild([
+                    previous,
+                    (taskmeta.content_type_id, taskmeta.object_id)])
+        if notify_enabled():
+            notify_changed([(taskmeta.content_type_id, taskmeta.object_id)])
+        pin_objects([(taskmeta.content_type_id, taskmeta.object_id)])
+        if outbox:
+            from .outbox import outbox_relay
+            outbox_relay.on_commit([entry.pk])
+            return ModelAsyncResult(task_id)
         try:
-            taskmeta = ModelTaskMeta.objects.get(task_id=task_id)
+            with created_pending([task_id] if previous is None else []):
+                return task.apply_async(args=args, kwargs=kwargs,
+                                        **shard_options(task_id, database,
+                                                        {'task_id': task_id}))
+        except (IOError, BrokerError) as e:
+            worker_status_cache.mark_offline(
+                "Error publishing task: %s" % e)
+            if taskmeta.dedup_key:
+                ModelTaskMeta.objects.using(database).filter(
+                    pk=taskmeta.pk).update(dedup_key=None)
+            raise
+
+    def _save_task_meta(self, task, task_id, block_ui, dedup, args, kwargs,
+                        database=None):
+        """
+        Create or reassign the task meta of ``task_id`` in ``database`` and
+        return it with the (content type, object id) it was assigned to
+        before and the running duplicate found by deduplication, if any.
+        """
+        previous = None
+        taskmeta = find_task_meta(task_id)
+        if taskmeta is not None:
+            previous = (taskmeta.content_type_id, taskmeta.object_id)
             taskmeta.content_object = self
             taskmeta.block_ui = block_ui
             taskmeta.task_name = task.name
             forget_if_ready(BaseAsyncResult(task_id))
-        except ModelTaskMeta.DoesNotExist:
+            if database is not None and database != shard_of(taskmeta):
+                # moved to the shard of this instance
+                ModelTaskMeta.objects.using(shard_of(taskmeta)).filter(
+                    pk=taskmeta.pk).delete()
+                taskmeta.pk = None
+                taskmeta.save(using=database, force_insert=True)
+            else:
+                taskmeta.save(using=database)
+        else:
             taskmeta = ModelTaskMeta(task_id=task_id, content_object=self,
                                      block_ui=block_ui, task_name=task.name)
-        taskmeta.save()
-        return task.apply_async(args=args, kwargs=kwargs, task_id=task_id)
+            if dedup:
+                taskmeta.dedup_key = make_dedup_key(
+                    taskmeta, args if dedup == 'args' else None,
+                    kwargs if dedup == 'args' else None)
+                existing = claim_task(taskmeta, database)
+                if existing is not None:
+                    return taskmeta, previous, existing
+            else:
+                taskmeta.save(using=database)
+        return taskmeta, previous, None
+
+    @classmethod
+    def apply_async_bulk(cls, task, instances=None, **kwargs):
+        return cls._default_manager.apply_async_many(
+            task, instances=instances, **kwargs)
 
     def get_task_results(self):
-        return map(lambda x: x.result, self.tasks.all())
+        return [x.result for x in self.tasks.all()]
 
     def get_task_result(self, task_id):
         return self.tasks.get(task_id=task_id).result
 
     def clear_task_results(self):
-        map(forget_if_ready, self.get_task_results())
+        for async_result in self.get_task_results():
+            forget_if_ready(async_result)
 
     def clear_task_result(self, task_id):
         forget_if_ready(self.get_task_result(task_id))
 
 
+def check_worker_status():
+    status = get_cached_worker_status()
+    if status['status_code'] in WORKER_ERROR_STATUSES:
+        raise WorkerError("Worker status is '%s'. %s" % (
+            status['status'], status.get('status_message', '')
+        ))
+
+
+def _utcnow():
+    return datetime.utcnow().replace(tzinfo=timezone.utc)
+
+
+def get_heartbeat_deadline():
+    """
+    Return the time after which a heartbeat proves that a task is alive, or
+    None if heartbeats are disabled.
+    """
+    timeout = DJCELERY_MODEL_SETTINGS.get('HEARTBEAT_TIMEOUT', 60)
+    if not timeout:
+        return None
+    return _utcnow() - timedelta(seconds=timeout)
+
+
+def count_timed_out_tasks(running, pending_task_timeout=0,
+                          non_block_ui_timeout=0):
+    """
+    Count the ``(state, created_at, heartbeat_at)`` of running tasks pending
+    for longer than ``pending_task_timeout``, started more than
+    ``non_block_ui_timeout`` seconds ago and with an expired heartbeat: the
+    status of these tasks changes without any write.
+    """
+    pending_task_timeout, non_block_ui_timeout = _get_task_timeouts(
+        pending_task_timeout, non_block_ui_timeout)
+    now = _utcnow()
+    heartbeat_deadline = get_heartbeat_deadline()
+    pending = blocking = expired = 0
+    for state, created_at, heartbeat_at in running:
+        elapsed = (now - created_at).total_seconds()
+        if state == ModelTaskMetaState.PENDING and \
+                elapsed > pending_task_timeout:
+            pending += 1
+        if state == ModelTaskMetaState.STARTED and \
+                elapsed > non_block_ui_timeout:
+            blocking += 1
+        if heartbeat_at is not None and heartbeat_deadline is not None and \
+                heartbeat_at < heartbeat_deadline:
+            expired += 1
+    return pending, blocking, expired
+
+
+def _get_task_timeouts(pending_task_timeout=0, non_block_ui_timeout=0):
+    if pending_task_timeout <= 0:
+        pending_task_timeout = DJCELERY_MODEL_SETTINGS.get(
+            'PENDING_TASK_TIMEOUT', 10 * 60)
+    if non_block_ui_timeout <= 0:
+        non_block_ui_timeout = DJCELERY_MODEL_SETTINGS.get(
+            'NON_BLOCK_UI_TIMEOUT', 1 * 60)
+    return pending_task_timeout, non_block_ui_timeout
+
+
+def build_task_status(last_ready_task, running_tasks, last_task_result=None):
+    status_obj = {}
+    now = _utcnow()
+
+    if running_tasks:
+        status_obj['running_tasks'] = []
+        status = get_worker_status_display(WORKER_BUSY)
+        for current_task in running_tasks:
+            running_time = now - current_task.created_at
+            status_obj['running_tasks'].append({
+                'task_id': current_task.task_id,
+                'task_name': current_task.task_name,
+                'state': current_task.get_state_display(),
+                'block_ui': current_task.block_ui,
+                'created_at': str(current_task.created_at),
+                'execution_time': running_time.total_seconds(),
+                'progress': current_task.progress,
+                'heartbeat_at': str(current_task.heartbeat_at)
+                if current_task.heartbeat_at else None,
+            })
+    else:
+        status = get_worker_status_display(WORKER_READY)
+
+    status_obj['status'] = status
+    if last_ready_task:
+        execution_time = last_ready_task.updated_at - last_ready_task.created_at
+
+        status_obj['last_ready_task'] = {
+            'task_id': last_ready_task.task_id,
+            'task_name': last_ready_task.task_name,
+            'state': last_ready_task.get_state_display(),
+            'created_at': str(last_ready_task.created_at),
+            'updated_at': str(last_ready_task.updated_at),
+        }
+        status_obj['last_ready_task']['execution_time'] = \
+            execution_time.total_seconds()
+
+        if isinstance(last_task_result, Exception):
+            status_obj['last_ready_task']['error_message'] = str(
+                last_task_result)
+        else:
+            status_obj['last_ready_task']['result'] = last_task_result
+
+    return status_obj
+
+
+class TaskStatusBuilder(object):
+    """
+    Build the get_task_status() dicts of many ``model`` instances from their
+    task metas and backend metas, without writing anything: backend state
+    mismatches, zombie pending tasks and block_ui timeouts are only applied
+    to the returned data.
+    """
+
+    def __init__(self, model, instances, pending_task_timeout=0,
+                 non_block_ui_timeout=0):
+        self.pending_task_timeout, self.non_block_ui_timeout = \
+            _get_task_timeouts(pending_task_timeout, non_block_ui_timeout)
+        self.content_type = ContentType.objects.get_for_model(model)
+        self.tasks_by_object = dict((instance.pk, [])
+                                    for instance in instances)
+        self.last_ready_tasks = {}
+        self.running_tasks = {}
+        self.heartbeat_deadline = get_heartbeat_deadline()
+
+    def get_querysets(self):
+        """
+        Return the querysets reading the task metas of all instances, one
+        per shard holding any of them.
+        """
+        querysets = []
+        for database, object_ids in group_objects(
+                self.content_type.pk, self.tasks_by_object.keys()).items():
+            if database is None:
+                database = read_database((self.content_type.pk, object_id)
+                                         for object_id in object_ids)
+            querysets.append(ModelTaskMeta.objects.using(database).filter(
+                content_type=self.content_type,
+                object_id__in=object_ids,
+            ).order_by('-updated_at', '-created_at'))
+        return querysets
+
+    def add_task_metas(self, taskmetas):
+        taskmetas = list(taskmetas)
+        state_store.load_states(taskmetas)
+        for taskmeta in taskmetas:
+            self.tasks_by_object[taskmeta.object_id].append(taskmeta)
+
+        for object_id, object_tasks in self.tasks_by_object.items():
+            for taskmeta in object_tasks:
+                if taskmeta.state in ModelTaskMetaState.READY_STATES:
+                    self.last_ready_tasks[object_id] = taskmeta
+                    break
+            self.running_tasks[object_id] = [
+                taskmeta for taskmeta in object_tasks
+                if taskmeta.state in ModelTaskMetaState.RUNNING_STATES]
+
+    def get_task_ids(self):
+        """
+        Return the ids of the tasks whose backend meta is needed: the last
+        ready tasks and the running tasks without a recent heartbeat.
+        """
+        task_ids = [t.task_id for t in self.last_ready_tasks.values()]
+        for object_tasks in self.running_tasks.values():
+            task_ids.extend(t.task_id for t in object_tasks
+                            if not t.is_alive(self.heartbeat_deadline))
+        return task_ids
+
+    def build(self, metas, failed=()):
+        from .reconcile import TaskReconciler
+        reconciler = TaskReconciler()
+        for object_tasks in self.running_tasks.values():
+            unknown = []
+            for t in object_tasks:
+                if not t.is_alive(self.heartbeat_deadline):
+                    unknown.append(t)
+                elif t.state == ModelTaskMetaState.PENDING:
+                    t.state = ModelTaskMetaState.STARTED
+            reconciler.reconcile(unknown, metas=metas, save=False,
+                                 failed=failed)
+
+        now = _utcnow()
+        statuses = {}
+        for object_id in self.tasks_by_object:
+            current_tasks = []
+            for t in self.running_tasks[object_id]:
+                elapsed = (now - t.created_at).total_seconds()
+                if t.state == ModelTaskMetaState.PENDING and \
+                        elapsed > self.pending_task_timeout:
+                    continue
+                if t.state == ModelTaskMetaState.STARTED and \
+                        elapsed > self.non_block_ui_timeout:
+                    t.block_ui = True
+                if t.state in ModelTaskMetaState.RUNNING_STATES:
+                    current_tasks.append(t)
+
+            last_ready_task = self.last_ready_tasks.get(object_id)
+            last_task_result = None
+            if last_ready_task:
+                meta = metas.get(last_ready_task.task_id)
+                if meta is not None:
+                    last_task_result = meta.get('result')
+            statuses[object_id] = build_task_status(
+                last_ready_task, current_tasks[::-1], last_task_result)
+        return statuses
+
+
+@instrument('get_task_statuses')
+def build_task_statuses(model, instances, pending_task_timeout=0,
+                        non_block_ui_timeout=0):
+    """
+    Build the get_task_status() dict of many ``model`` instances at once and
+    return them keyed by instance pk.
+
+    All task metas are read with one query (per shard) and all backend
+    states and results with one batched fetch. Nothing is written.
+    """
+    instances = list(instances)
+    builder = TaskStatusBuilder(model, instances, pending_task_timeout,
+                                non_block_ui_timeout)
+    prefetched = [getattr(instance, '_prefetched_tasks', lambda: None)()
+                  for instance in instances]
+    if instances and all(tasks is not None for tasks in prefetched):
+        builder.add_task_metas(sorted(
+            (t for tasks in prefetched for t in tasks), reverse=True,
+            key=lambda t: (t.updated_at, t.created_at)))
+    else:
+        # all tasks of an object are in one shard, so their order is kept
+        builder.add_task_metas(taskmeta
+                               for queryset in builder.get_querysets()
+                               for taskmeta in queryset)
+    task_ids = builder.get_task_ids()
+    failed = set()
+    try:
+        metas = get_task_metas(task_ids, failed=failed)
+    except Exception as e:
+        logger.error("Unable to fetch task states: %s" % e)
+        metas, failed = {}, set(task_ids)
+    return builder.build(metas, failed)
+
+
+def tasks_exist(model, states=None):
+    """
+    Return an Exists() expression telling whether an object of ``model`` has
+    tasks in one of ``states`` (any task if None), for use in annotate(),
+    or None on Django versions without Exists and for sharded task metas.
+    """
+    if Exists is None or sharding_enabled():
+        return None
+    content_type = ContentType.objects.get_for_model(model)
+    taskmetas = ModelTaskMeta.objects.filter(content_type=content_type)
+    if states is not None:
+        taskmetas = state_store.filter_states(taskmetas, states)
+    return Exists(taskmetas.filter(object_id=OuterRef('pk')).values('pk'))
+
+
+def filter_tasks_exist(queryset, states=None, exists=True):
+    """
+    Filter ``queryset`` on objects having (or not having) tasks in
+    ``states`` with a correlated EXISTS subquery, so that objects with
+    several matching tasks are not duplicated by a JOIN. Django versions
+    before 3.0 can only filter on an annotated Exists(), which puts the
+    subquery into the plan twice, and use an ``object_id`` subquery
+    instead, sharded task metas the list of object ids read from every
+    shard.
+    """
+    if django.VERSION >= (3, 0):
+        expression = tasks_exist(queryset.model, states)
+        if expression is not None:
+            return queryset.filter(expression if exists else ~expression)
+    content_type = ContentType.objects.get_for_model(queryset.model)
+    object_ids = []
+    for database in get_databases():
+        taskmetas = ModelTaskMeta.objects.using(database).filter(
+            content_type=content_type)
+        if states is not None:
+            taskmetas = state_store.filter_states(taskmetas, states)
+        if database is None:
+            object_ids = taskmetas.values('object_id')
+        else:
+            object_ids.extend(taskmetas.values_list(
+                'object_id', flat=True).distinct())
+    if exists:
+        return queryset.filter(pk__in=object_ids)
+    return queryset.exclude(pk__in=object_ids)
+
+
+def format_task_version(version_info):
+    if not version_info['count']:
+        return '0'
+    version = '%d-%s' % (version_info['count'],
+                         version_info['updated_at'].isoformat())
+    if version_info.get('states'):
+        version += '-' + hashlib.md5(repr(
+            version_info['states']).encode('utf-8')).hexdigest()[:8]
+    if any(version_info.get('timed_out', ())):
+        version += '-t%d.%d.%d' % version_info['timed_out']
+    return version
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _pk_chunks(queryset, size):
+    """
+    Yield the pks of ``queryset`` in primary key order, ``size`` at a time,
+    reading every chunk with its own query so that rows may be deleted in
+    between.
+    """
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).order_by('pk')
+                   .values_list('pk', flat=True)[:size])
+        if pks:
+            last_pk = pks[-1]
+            yield pks
+        if len(pks) < size:
+            return
+
+
+def _object_chunks(queryset, size):
+    """
+    Yield ``queryset`` restricted to the task metas of ``size`` objects at a
+    time, in content type and object id order.
+    """
+    content_type_ids = list(queryset.order_by('content_type').values_list(
+        'content_type', flat=True).distinct())
+    for content_type_id in content_type_ids:
+        tasks = queryset.filter(content_type=content_type_id)
+        last_object_id = -1
+        while True:
+            object_ids = list(tasks.filter(object_id__gt=last_object_id)
+                              .order_by('object_id')
+                              .values_list('object_id', flat=True)
+                              .distinct()[:size])
+            if object_ids:
+                last_object_id = object_ids[-1]
+                yield tasks.filter(object_id__in=object_ids)
+            if len(object_ids) < size:
+                break
+
+
+def _rank_by_object(queryset):
+    """
+    Yield ``(pk, rank, updated_at)`` of the task metas in ``queryset``,
+    ranked from 1 (the most recently updated task of an object) upwards.
+    """
+    rows = queryset.order_by(
+        'content_type', 'object_id', '-updated_at', '-created_at',
+    ).values_list('pk', 'content_type', 'object_id', 'updated_at')
+    last_key, rank = None, 0
+    for pk, content_type_id, object_id, updated_at in rows:
+        key = (content_type_id, object_id)
+        rank = rank + 1 if key == last_key else 1
+        last_key = key
+        yield pk, rank, updated_at
+
+
+def make_dedup_key(taskmeta, args=None, kwargs=None):
+    key = '%s:%s:%s' % (taskmeta.content_type_id, taskmeta.object_id,
+                        taskmeta.task_name)
+    if args is not None or kwargs is not None:
+        key += ':' + json.dumps([args, kwargs], sort_keys=True, default=str)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def claim_task(taskmeta, using=None):
+    """
+    Save ``taskmeta`` unless another running task holds its dedup_key, and
+    return that task in that case. The unique dedup_key column makes the
+    claim atomic; keys are released when a task leaves the running states.
+    """
+    for _ in range(3):
+        try:
+            with transaction.atomic(using=using):
+                taskmeta.save(force_insert=True, using=using)
+            return None
+        except IntegrityError:
+            taskmeta.pk = None
+            existing = ModelTaskMeta.objects.using(using).filter(
+                dedup_key=taskmeta.dedup_key).first()
+            if existing is not None:
+                return existing
+    raise WorkerError("Unable to claim task %s" % taskmeta.task_id)
+
+
+def find_task_meta(task_id):
+    """
+    Return the task meta of ``task_id``, looked up in every shard unless
+    its shard is known, or None.
+    """
+    for database in group_task_ids([task_id]):
+        try:
+            return ModelTaskMeta.objects.using(database).get(task_id=task_id)
+        except ModelTaskMeta.DoesNotExist:
+            pass
+    return None
+
+
+def task_state_updates(state, updated_at):
+    updates = {'state': state, 'updated_at': updated_at}
+    if state not in ModelTaskMetaState.RUNNING_STATES:
+        updates['dedup_key'] = None
+    return updates
+
+
 def forget_if_ready(async_result):
     if async_result and async_result.ready():
         async_result.forget()
 
 
+class created_pending(object):
+    """
+    Context manager marking task metas just created as PENDING, so that
+    handle_after_task_publish does not write the same state again while
+    their tasks are published from this thread.
+    """
+
+    def __init__(self, task_ids):
+        self.task_ids = set(task_ids)
+
+    def __enter__(self):
+        if not hasattr(_local, 'created_pending'):
+            _local.created_pending = set()
+        _local.created_pending.update(self.task_ids)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.created_pending.difference_update(self.task_ids)
+
+
+def is_created_pending(task_id):
+    return task_id in getattr(_local, 'created_pending', ())
+
+
+def set_task_state(task_id, state):
+    set_tasks_state([task_id], state)
+
+
+@use_primary()
+def set_tasks_state(task_ids, state, using=None):
+    if using is None and sharding_enabled():
+        for database, shard_task_ids in group_task_ids(task_ids).items():
+            set_tasks_state(shard_task_ids, state, using=database)
+        return
+    queryset = ModelTaskMeta.objects.using(using).filter(task_id__in=task_ids)
+    now = timezone.now()
+    track_summary = ModelTaskSummary.objects.enabled()
+    if not track_summary and not notify_enabled():
+        queryset.update(**task_state_updates(state, now))
+        return
+    with transaction.atomic(using=using):
+        if track_summary:
+            queryset = queryset.select_for_update()
+        rows = list(queryset.values_list(
+            'task_id', 'content_type', 'object_id', 'state'))
+        queryset.update(**task_state_updates(state, now))
+        if track_summary:
+            for task_id, content_type_id, object_id, old_state in rows:
+                ModelTaskSummary.objects.record_transition(
+                    content_type_id, object_id, old_state, state,
+                    task_id=task_id, updated_at=now)
+    notify_changed((row[1], row[2]) for row in rows)
+
+
+def delete_task(task_id):
+    delete_tasks([task_id])
+
+
+@use_primary()
+def delete_tasks(task_ids, using=None):
+    if using is None and sharding_enabled():
+        for database, shard_task_ids in group_task_ids(task_ids).items():
+            delete_tasks(shard_task_ids, using=database)
+        return
+    queryset = ModelTaskMeta.objects.using(using).filter(task_id__in=task_ids)
+    track_summary = ModelTaskSummary.objects.enabled()
+    if not track_summary and not notify_enabled():
+        queryset.delete()
+        return
+    with transaction.atomic(using=using):
+        if track_summary:
+            queryset = queryset.select_for_update()
+        rows = list(queryset.values_list(
+            'content_type', 'object_id', 'state'))
+        queryset.delete()
+        if track_summary:
+            for content_type_id, object_id, old_state in rows:
+                ModelTaskSummary.objects.record_transition(
+                    content_type_id, object_id, old_state, None)
+    notify_changed((row[0], row[1]) for row in rows)
+
+
+@use_primary()
+def purge_tasks(pks, archive=False, using=None):
+    """
+    Delete the task metas with the given primary keys (in the shard
+    ``using``), optionally copying them to ModelTaskMetaArchive in the same
+    transaction, and refresh the summaries of the affected objects.
+    """
+    queryset = ModelTaskMeta.objects.using(using).filter(pk__in=pks)
+    track_summary = ModelTaskSummary.objects.enabled()
+    if not archive and not track_summary and not notify_enabled():
+        queryset.delete()
+        return
+    with transaction.atomic(using=using):
+        rows = list(queryset.select_for_update())
+        if archive:
+            # the archive of sharded task metas is in another database and
+            # commits first, so a failed delete only leaves duplicates
+            ModelTaskMetaArchive.objects.bulk_create(
+                [ModelTaskMetaArchive.from_task_meta(t) for t in rows])
+        queryset.delete()
+    pairs = set((t.content_type_id, t.object_id) for t in rows)
+    if track_summary:
+        ModelTaskSummary.objects.rebuild(pairs)
+    if notify_enabled():
+        notify_changed(pairs)
+
+
 @signals.after_task_publish.connect
-def handle_after_task_publish(sender=None, body=None, **kwargs):
+@instrument('handle_after_task_publish')
+def handle_after_task_publish(sender=None, body=None, headers=None,
+                              **kwargs):
     if body and 'id' in body:
-        queryset = ModelTaskMeta.objects.filter(task_id=body['id'])
-        queryset.update(state=ModelTaskMetaState.PENDING,
-                        updated_at=timezone.now())
+        shard_hints.set(body['id'], get_shard_hint(headers=headers))
+        if not is_created_pending(body['id']):
+            state_store.set_state(body['id'], ModelTaskMetaState.PENDING)
 
 
 @signals.task_prerun.connect
-def handle_task_prerun(sender=None, task_id=None, **kwargs):
+@instrument('handle_task_prerun')
+def handle_task_prerun(sender=None, task_id=None, task=None, **kwargs):
     if task_id:
-        queryset = ModelTaskMeta.objects.filter(task_id=task_id)
-        queryset.update(state=ModelTaskMetaState.STARTED,
-                        updated_at=timezone.now())
+        shard_hints.set(task_id, get_shard_hint(getattr(task, 'request',
+                                                        None)))
+        state_store.set_state(task_id, ModelTaskMetaState.STARTED)
 
 
 @signals.task_postrun.connect
-def handle_task_postrun(sender=None, task_id=None, state=None, **kwargs):
+@instrument('handle_task_postrun')
+def handle_task_postrun(sender=None, task_id=None, task=None, state=None,
+                        **kwargs):
     if task_id and state:
-        queryset = ModelTaskMeta.objects.filter(task_id=task_id)
-        queryset.update(state=ModelTaskMetaState.lookup(state),
-                        updated_at=timezone.now())
+        shard_hints.set(task_id, get_shard_hint(getattr(task, 'request',
+                                                        None)))
+        state_store.set_state(task_id, ModelTaskMetaState.lookup(state))
 
 
 @signals.task_revoked.connect
+@instrument('handle_task_revoked')
 def handle_task_revoked(sender=None, request=None, **kwargs):
     if request and request.id:
-        queryset = ModelTaskMeta.objects.filter(task_id=request.id)
-        queryset.delete()
+        shard_hints.set(request.id, get_shard_hint(request))
+        state_store.delete(request.id)
@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .instrumentation import instrument
+from .models import ModelTaskOutbox, BrokerError
+from .status import worker_status_cache
+
+DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
+
+logger = logging.getLogger('')
+
+
+class OutboxRelay(object):
+    """
+    Publishes the task messages written to ModelTaskOutbox.
+
+    drain() publishes pending messages in batches of ``batch_size``: every
+    batch is locked (skipping rows locked by other relays where the database
+    supports it), published through a single producer connection and
+    deleted in one transaction. Messages are delivered at least once; a
+    message whose publish fails stays in the outbox for the next drain.
+
+    With DJCELERY_MODEL['OUTBOX_PUBLISH_ON_COMMIT'] (the default) the
+    messages written by a transaction are additionally published by a
+    background thread of the same process as soon as it commits, so the
+    periodic relay only has to pick up what this fast path missed.
+    """
+
+    def __init__(self, batch_size=None, publish_on_commit=None):
+        if batch_size is None:
+            batch_size = DJCELERY_MODEL_SETTINGS.get('OUTBOX_BATCH_SIZE', 100)
+        if publish_on_commit is None:
+            publish_on_commit = DJCELERY_MODEL_SETTINGS.get(
+                'OUTBOX_PUBLISH_ON_COMMIT', True)
+        self.batch_size = batch_size
+        self.publish_on_commit = publish_on_commit
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._thread = None
+
+    def on_commit(self, pks):
+        if not self.publish_on_commit:
+            return
+        pks = list(pks)
+        if hasattr(transaction, 'on_commit'):
+            transaction.on_commit(lambda: self.schedule(pks))
+        else:
+            self.schedule(pks)
+
+    def schedule(self, pks):
+        with self._lock:
+            self._pending.update(pks)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    pks, self._pending = list(self._pending), set()
+                    if not pks:
+                        self._thread = None
+                        return
+                try:
+                    self.publish(ModelTaskOutbox.objects.filter(pk__in=pks))
+                except Exception as e:
+                    logger.error("Unable to publish %d outbox messages: %s" % (
+                        len(pks), e))
+        finally:
+            connection.close()
+
+    def drain(self, limit=None):
+        """
+        Publish pending messages until the outbox is empty, a publish fails
+        or ``limit`` messages were published; return the number published.
+        """
+        published = 0
+        while limit is None or published < limit:
+            size = self.batch_size
+            if limit is not None:
+                size = min(size, limit - published)
+            count, failed = self._publish_batch(
+                ModelTaskOutbox.objects.all(), size)
+            published += count
+            if failed or count < size:
+                break
+        return published
+
+    def publish(self, queryset):
+        """
+        Publish the messages of ``queryset`` not locked by another relay.
+        """
+        published = 0
+        while True:
+            count, failed = self._publish_batch(queryset, self.batch_size)
+            published += count
+            if failed or count < self.batch_size:
+                return published
+
+    @instrument('outbox_publish')
+    def _publish_batch(self, queryset, size):
+        from celery import current_app
+        with transaction.atomic():
+            entries = list(self._lock_entries(queryset.order_by('pk'))[:size])
+            if not entries:
+                return 0, False
+            published = []
+            failed = False
+            with current_app.producer_or_acquire() as producer:
+                for entry in entries:
+                    try:
+                        current_app.send_task(
+                            entry.task_name, args=entry.get_args(),
+                            kwargs=entry.get_kwargs(),
+                            task_id=entry.task_id, producer=producer)
+                    except (IOError, BrokerError) as e:
+                        worker_status_cache.mark_offline(
+                            "Error publishing task: %s" % e)
+                        ModelTaskOutbox.objects.filter(pk=entry.pk).update(
+                            attempts=entry.attempts + 1, last_error=str(e))
+                        failed = True
+                        break
+                    published.append(entry.pk)
+            ModelTaskOutbox.objects.filter(pk__in=published).delete()
+        return len(published), failed
+
+    def _lock_entries(self, queryset):
+        if getattr(connection.features,
+                   'has_select_for_update_skip_locked', False):
+            return queryset.select_for_update(skip_locked=True)
+        return queryset.select_for_update()
+
+    def run(self, interval=1.0):
+        """
+        Drain the outbox every ``interval`` seconds, forever.
+        """
+        while True:
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error("Unable to drain the task outbox: %s" % e)
+            time.sleep(interval)
+
+
+outbox_relay = OutboxRelay()
@@ -0,0 +1,109 @@
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from celery import signals
+
+from .instrumentation import instrument
+from .pubsub import notify_changed, notify_enabled
+
+DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
+
+
+class ProgressReporter(object):
+    """
+    Writes the progress and heartbeat of running tasks to ModelTaskMeta.
+
+    At most one UPDATE per task is written every ``min_interval`` seconds
+    (DJCELERY_MODEL['PROGRESS_MIN_INTERVAL']); reports in between only
+    replace the progress kept for the next write, so a task may report as
+    often as it likes.
+    """
+
+    def __init__(self, min_interval=None):
+        if min_interval is None:
+            min_interval = DJCELERY_MODEL_SETTINGS.get(
+                'PROGRESS_MIN_INTERVAL', 5)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._written = {}
+        self._progress = {}
+
+    def report(self, task_id, progress=None):
+        """
+        Record that ``task_id`` is alive and, if given, its ``progress`` in
+        percent. Return whether it was written.
+        """
+        now = time.time()
+        with self._lock:
+            if progress is not None:
+                self._progress[task_id] = max(0, min(100, int(progress)))
+            if now - self._written.get(task_id, 0) < self.min_interval:
+                return False
+            self._written[task_id] = now
+            progress = self._progress.pop(task_id, None)
+        self._write(task_id, progress)
+        return True
+
+    def finish(self, task_id):
+        with self._lock:
+            self._written.pop(task_id, None)
+            self._progress.pop(task_id, None)
+
+    @instrument('report_progress')
+    def _write(self, task_id, progress):
+        from .models import ModelTaskMeta
+        from .sharding import group_task_ids
+        now = timezone.now()
+        # updated_at changes the task version, so the status (which shows
+        # the heartbeat and progress) is not answered from a stale ETag
+        updates = {'heartbeat_at': now, 'updated_at': now}
+        if progress is not None:
+            updates['progress'] = progress
+        for database in group_task_ids([task_id]):
+            queryset = ModelTaskMeta.objects.using(database).filter(
+                task_id=task_id)
+            if notify_enabled():
+                pairs = list(queryset.values_list('content_type', 'object_id'))
+                queryset.update(**updates)
+                notify_changed(pairs)
+            else:
+                queryset.update(**updates)
+
+
+progress_reporter = ProgressReporter()
+
+
+def _current_task_id():
+    from celery import current_task
+    if current_task is None or current_task.request is None:
+        return None
+    return current_task.request.id
+
+
+def report_progress(progress, task_id=None):
+    """
+    Report the progress (0 - 100) of the current task (or ``task_id``),
+    which also counts as heartbeat.
+    """
+    task_id = task_id or _current_task_id()
+    if task_id:
+        return progress_reporter.report(task_id, progress)
+    return False
+
+
+def heartbeat(task_id=None):
+    """
+    Report that the current task (or ``task_id``) is alive.
+    """
+    task_id = task_id or _current_task_id()
+    if task_id:
+        return progress_reporter.report(task_id)
+    return False
+
+
+@signals.task_postrun.connect
+def handle_task_postrun(sender=None, task_id=None, **kwargs):
+    if task_id:
+        progress_reporter.finish(task_id)
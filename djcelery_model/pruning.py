@@ -0,0 +1,147 @@
+from datetime import timedelta
+import logging
+
+from django.utils import timezone
+
+from .instrumentation import instrument
+from .models import ModelTaskMeta, ModelTaskMetaState, purge_tasks, \
+    get_heartbeat_deadline, _get_task_timeouts, _object_chunks, _pk_chunks, \
+    _rank_by_object
+from .reconcile import TaskReconciler
+from .retention import exclude_retained, get_retention_policies
+from .routing import use_primary
+from .sharding import get_databases, shard_of
+
+logger = logging.getLogger('')
+
+
+class TaskPruner(object):
+    """
+    Garbage collector for ModelTaskMeta rows.
+
+    Removes skipped tasks and all but the last ready task of every object
+    (leaving tasks covered by a retention policy to the RetentionEngine),
+    reconciles running tasks without a recent heartbeat with the result
+    backend, removes tasks pending for longer than ``pending_task_timeout``
+    and flags tasks started more than ``non_block_ui_timeout`` seconds ago
+    with ``block_ui``.
+    Rows are read and processed in batches of ``batch_size`` rows (or
+    objects) so that no statement locks a large part of the table. Without
+    a ``queryset`` every shard is pruned.
+    """
+
+    def __init__(self, pending_task_timeout=0, non_block_ui_timeout=0,
+                 batch_size=1000, reconciler=None):
+        self.pending_task_timeout, self.non_block_ui_timeout = \
+            _get_task_timeouts(pending_task_timeout, non_block_ui_timeout)
+        self.batch_size = batch_size
+        self.reconciler = reconciler or TaskReconciler()
+        self.retention_policies = get_retention_policies()
+
+    @instrument('prune')
+    @use_primary()
+    def prune(self, queryset=None):
+        if queryset is not None:
+            return self._prune(queryset)
+        stats = {}
+        for database in get_databases():
+            shard_stats = self._prune(ModelTaskMeta.objects.using(database))
+            for key, value in shard_stats.items():
+                stats[key] = stats.get(key, 0) + value
+        return stats
+
+    def _prune(self, queryset):
+        stats = {
+            'skipped': self.delete_skipped(queryset),
+            'old_ready': self.delete_old_ready(queryset),
+        }
+        stats.update(self.reconcile_running(queryset))
+        stats['block_ui'] = self.block_ui(queryset)
+        removed_n = stats['skipped'] + stats['old_ready'] + stats['zombies']
+        if removed_n > 0:
+            logger.info("%d old tasks removed" % removed_n)
+        return stats
+
+    def delete_skipped(self, queryset):
+        skipped = exclude_retained(queryset.skipped(),
+                                   self.retention_policies)
+        deleted = 0
+        for pks in _pk_chunks(skipped, self.batch_size):
+            deleted += self._delete(pks, shard_of(queryset))
+        return deleted
+
+    def delete_old_ready(self, queryset):
+        ready = exclude_retained(queryset.ready(), self.retention_policies)
+        deleted = 0
+        for tasks in _object_chunks(ready, self.batch_size):
+            deleted += self._delete_batches(
+                [pk for pk, rank, _ in _rank_by_object(tasks) if rank > 1],
+                shard_of(queryset))
+        return deleted
+
+    def reconcile_running(self, queryset):
+        stats = {'reconciled': 0, 'zombies': 0, 'forgotten': 0}
+        last_pk = 0
+        running = queryset.running()
+        heartbeat_deadline = get_heartbeat_deadline()
+        if heartbeat_deadline is not None:
+            running = running.exclude(heartbeat_at__gte=heartbeat_deadline)
+        while True:
+            batch = list(running.filter(pk__gt=last_pk)
+                         .order_by('pk')[:self.batch_size])
+            if not batch:
+                return stats
+            last_pk = batch[-1].pk
+            try:
+                result = self.reconciler.reconcile(batch)
+            except Exception as e:
+                logger.error("Unable to fetch task states: %s" % e)
+                return stats
+            stats['reconciled'] += result.changed_count
+
+            for t in result.failed:
+                logger.error("Task %s: wrong state, forget" % t)
+            stats['forgotten'] += self._delete_batches(
+                [t.pk for t in result.failed], shard_of(queryset))
+
+            pending_deadline = timezone.now() - timedelta(
+                seconds=self.pending_task_timeout)
+            zombies = []
+            for t in batch:
+                if t.state == ModelTaskMetaState.PENDING and \
+                        t.created_at < pending_deadline:
+                    logger.warn("Task %s removed: pending since %s" % (
+                        t, t.created_at))
+                    zombies.append(t.pk)
+            stats['zombies'] += self._delete_batches(zombies,
+                                                     shard_of(queryset))
+
+    def block_ui(self, queryset):
+        now = timezone.now()
+        deadline = now - timedelta(seconds=self.non_block_ui_timeout)
+        return queryset.started().filter(
+            block_ui=False, created_at__lt=deadline,
+        ).update(block_ui=True, updated_at=now)
+
+    def _delete_batches(self, pks, using=None):
+        deleted = 0
+        batch = []
+        for pk in pks:
+            batch.append(pk)
+            if len(batch) >= self.batch_size:
+                deleted += self._delete(batch, using)
+                batch = []
+        if batch:
+            deleted += self._delete(batch, using)
+        return deleted
+
+    def _delete(self, pks, using=None):
+        purge_tasks(pks, using=using)
+        return len(pks)
+
+
+def prune_tasks(pending_task_timeout=0, non_block_ui_timeout=0,
+                batch_size=1000):
+    pruner = TaskPruner(pending_task_timeout, non_block_ui_timeout,
+                        batch_size)
+    return pruner.prune()
@@ -0,0 +1,95 @@
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    from django.utils.module_loading import import_string
+except ImportError:
+    from django.utils.module_loading import import_by_path as import_string
+
+DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
+
+
+class LocalPubSub(object):
+    """
+    In-process change notifications.
+
+    Every channel has a version counter that is increased by publish();
+    wait() blocks until the version of a channel differs from the given one
+    or the timeout expires. Only the ``max_channels`` most recently
+    published channels keep their counter, unless someone waits on them;
+    a forgotten channel starts over at 0, so a listener not waiting at that
+    moment may wake up early or only at its timeout. Notifications only
+    reach listeners in the same process; use a backend with the same
+    interface on top of a shared broker (e.g. Redis) to notify across
+    processes.
+    """
+
+    def __init__(self, max_channels=10000):
+        self.max_channels = max_channels
+        self._condition = threading.Condition()
+        self._versions = OrderedDict()
+        self._waiters = {}
+
+    def publish(self, channel):
+        with self._condition:
+            self._versions[channel] = self._versions.pop(channel, 0) + 1
+            self._evict(channel)
+            self._condition.notify_all()
+
+    def _evict(self, published):
+        excess = len(self._versions) - self.max_channels
+        if excess <= 0:
+            return
+        evicted = []
+        for channel in self._versions:
+            if len(evicted) >= excess:
+                break
+            if channel != published and channel not in self._waiters:
+                evicted.append(channel)
+        for channel in evicted:
+            del self._versions[channel]
+
+    def version(self, channel):
+        return self._versions.get(channel, 0)
+
+    def wait(self, channel, version, timeout):
+        deadline = time.time() + timeout
+        with self._condition:
+            self._waiters[channel] = self._waiters.get(channel, 0) + 1
+            try:
+                while self._versions.get(channel, 0) == version:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                return self._versions.get(channel, 0)
+            finally:
+                self._waiters[channel] -= 1
+                if not self._waiters[channel]:
+                    del self._waiters[channel]
+
+
+def task_channel(content_type_id, object_id):
+    return 'djcelery_model:%s:%s' % (content_type_id, object_id)
+
+
+def notify_enabled():
+    return DJCELERY_MODEL_SETTINGS.get('NOTIFY_CHANGES', False)
+
+
+def notify_changed(pairs):
+    for content_type_id, object_id in set(pairs):
+        pubsub.publish(task_channel(content_type_id, object_id))
+
+
+def _get_pubsub():
+    backend = DJCELERY_MODEL_SETTINGS.get('PUBSUB_BACKEND')
+    if backend:
+        return import_string(backend)()
+    return LocalPubSub()
+
+
+pubsub = _get_pubsub()
@@ -0,0 +1,143 @@
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .instrumentation import instrument
+from .models import ModelTaskMeta, ModelTaskMetaState, ModelTaskSummary, \
+    task_state_updates
+from .pubsub import notify_changed, notify_enabled
+from .results import get_task_metas, _pending_meta
+from .routing import use_primary
+from .sharding import get_databases, shard_of
+from .stores import state_store
+
+logger = logging.getLogger('')
+
+#: states stored as such before migration 0012, all others were FAILURE
+STATES_BEFORE_REGISTRY = ('PENDING', 'STARTED', 'RETRY', 'FAILURE',
+                          'SUCCESS', 'IGNORED')
+
+
+class ReconcileResult(object):
+    def __init__(self):
+        self.changed = {}
+        self.failed = []
+
+    @property
+    def changed_count(self):
+        return sum(len(tasks) for tasks in self.changed.values())
+
+
+class TaskReconciler(object):
+    """
+    Bring the state of running ModelTaskMeta rows in line with the result
+    backend, using one batched backend read for all given tasks and one
+    UPDATE per corrected target state.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    def fetch(self, tasks, failed=None):
+        return get_task_metas([t.task_id for t in tasks],
+                              backend=self.backend, failed=failed)
+
+    @instrument('reconcile')
+    def reconcile(self, tasks, metas=None, save=True, failed=None):
+        """
+        Update the in-memory ``state`` of every task from its backend meta
+        and, if ``save`` is set, persist the corrections. Tasks without a
+        backend meta are PENDING; tasks whose meta could not be read are
+        left unchanged and collected in ``failed``.
+        ``metas`` (and the ids of the tasks in ``failed``) may be passed if
+        they have already been fetched.
+        """
+        tasks = list(tasks)
+        state_store.load_states(tasks)
+        if metas is None:
+            failed = set()
+            metas = self.fetch(tasks, failed)
+        failed = failed or ()
+        result = ReconcileResult()
+        for t in tasks:
+            meta = metas.get(t.task_id)
+            if meta is None:
+                if t.task_id in failed:
+                    result.failed.append(t)
+                    continue
+                meta = _pending_meta(t.task_id)
+            res_state = ModelTaskMetaState.lookup(meta['status'])
+            if t.state != res_state:
+                t.state = res_state
+                result.changed.setdefault(res_state, []).append(t)
+
+        if save and result.changed:
+            now = timezone.now()
+            for state, changed_tasks in result.changed.items():
+                if not state_store.persists(state):
+                    state_store.set_states(
+                        [t.task_id for t in changed_tasks], state)
+                    continue
+                by_shard = {}
+                for t in changed_tasks:
+                    by_shard.setdefault(shard_of(t), []).append(t.pk)
+                for database, pks in by_shard.items():
+                    ModelTaskMeta.objects.using(database).filter(
+                        pk__in=pks,
+                    ).update(**task_state_updates(state, now))
+                for t in changed_tasks:
+                    t.updated_at = now
+                    logger.warn("Task %s state changed (mismatch)" % t)
+            pairs = set((t.content_type_id, t.object_id)
+                        for changed_tasks in result.changed.values()
+                        for t in changed_tasks)
+            if ModelTaskSummary.objects.enabled():
+                ModelTaskSummary.objects.rebuild(pairs)
+            if notify_enabled():
+                notify_changed(pairs)
+        return result
+
+
+@instrument('remap_failed_tasks')
+@use_primary()
+def remap_failed_tasks(batch_size=500, backend=None):
+    """
+    Give FAILURE task metas of states that were stored as FAILURE before
+    migration 0012 registered them (REVOKED, RECEIVED, REJECTED and custom
+    states) their state from the result backend. Rows are read in batches
+    of ``batch_size`` and every batch is committed on its own; return the
+    number of remapped task metas.
+    """
+    remapped = 0
+    for database in get_databases():
+        failed = ModelTaskMeta.objects.using(database).filter(
+            state=ModelTaskMetaState.FAILURE)
+        last_pk = 0
+        while True:
+            batch = list(failed.filter(pk__gt=last_pk).order_by('pk')
+                         .values_list('pk', 'task_id', 'content_type',
+                                      'object_id')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            metas = get_task_metas([row[1] for row in batch],
+                                   backend=backend)
+            by_state = {}
+            pairs = set()
+            for pk, task_id, content_type_id, object_id in batch:
+                meta = metas.get(task_id)
+                if meta is None or meta['status'] in STATES_BEFORE_REGISTRY \
+                        or meta['status'] not in ModelTaskMetaState.CODES:
+                    continue
+                by_state.setdefault(ModelTaskMetaState.CODES[meta['status']],
+                                    []).append(pk)
+                pairs.add((content_type_id, object_id))
+            with transaction.atomic(using=database):
+                for state, pks in by_state.items():
+                    remapped += failed.filter(pk__in=pks).update(state=state)
+            if pairs and ModelTaskSummary.objects.enabled():
+                ModelTaskSummary.objects.rebuild(pairs)
+            if pairs and notify_enabled():
+                notify_changed(pairs)
+    return remapped
@@ -0,0 +1,105 @@
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from celery import current_app, states
+
+from .instrumentation import instrument
+
+
+def _pending_meta(task_id):
+    return {'task_id': task_id, 'status': states.PENDING, 'result': None}
+
+
+def _decode_meta(backend, task_id, payload):
+    meta = backend.decode(payload)
+    if meta.get('status') in states.EXCEPTION_STATES:
+        meta['result'] = backend.exception_to_python(meta.get('result'))
+    meta.setdefault('task_id', task_id)
+    return meta
+
+
+@instrument('backend_fetch')
+def get_task_metas(task_ids, backend=None, failed=None):
+    """
+    Fetch the result backend metadata of many tasks at once and return a
+    dict mapping task ids to metas with at least ``status`` and ``result``.
+
+    Key-value backends (Redis, Memcached, ...) are read with a single
+    ``mget``; backends storing results in a Django model with one
+    ``task_id__in`` query; any other backend falls back to one
+    ``get_task_meta`` call per task. Tasks without a stored meta are
+    PENDING; tasks whose meta can not be read are left out of the returned
+    dict and added to the ``failed`` set, if one is given.
+    """
+    if backend is None:
+        backend = current_app.backend
+    task_ids = list(set(task_ids))
+    if not task_ids:
+        return {}
+
+    if hasattr(backend, 'mget') and hasattr(backend, 'get_key_for_task'):
+        keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+        payloads = backend.mget(keys)
+        if isinstance(payloads, Mapping):
+            # the cache backends return a dict from get_multi()
+            payloads = [payloads.get(key) for key in keys]
+        metas = {}
+        for task_id, payload in zip(task_ids, payloads):
+            if payload:
+                metas[task_id] = _decode_meta(backend, task_id, payload)
+            else:
+                metas[task_id] = _pending_meta(task_id)
+        return metas
+
+    task_model = getattr(backend, 'TaskModel', None)
+    if task_model is not None and hasattr(task_model, 'to_dict'):
+        metas = dict((task_id, _pending_meta(task_id))
+                     for task_id in task_ids)
+        queryset = task_model._default_manager.filter(task_id__in=task_ids)
+        for obj in queryset:
+            metas[obj.task_id] = obj.to_dict()
+        return metas
+
+    metas = {}
+    for task_id in task_ids:
+        try:
+            metas[task_id] = backend.get_task_meta(task_id)
+        except Exception:
+            if failed is not None:
+                failed.add(task_id)
+    return metas
+
+
+@instrument('backend_forget')
+def forget_task_results(task_ids, backend=None):
+    """
+    Remove the results of many tasks from the result backend, with one
+    call per batch where the backend supports it.
+    """
+    if backend is None:
+        backend = current_app.backend
+    task_ids = list(task_ids)
+    if not task_ids:
+        return
+
+    if hasattr(backend, 'get_key_for_task'):
+        keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+        client = getattr(backend, 'client', None)
+        if hasattr(client, 'delete_multi'):
+            client.delete_multi(keys)
+        elif hasattr(client, 'pipeline'):
+            client.delete(*keys)
+        else:
+            for key in keys:
+                backend.delete(key)
+        return
+
+    task_model = getattr(backend, 'TaskModel', None)
+    if task_model is not None:
+        task_model._default_manager.filter(task_id__in=task_ids).delete()
+        return
+
+    for task_id in task_ids:
+        backend.forget(task_id)
@@ -0,0 +1,210 @@
+from datetime import date, timedelta
+import logging
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, router
+from django.db.models import Q
+from django.utils import timezone
+
+from .instrumentation import instrument
+from .models import DJCELERY_MODEL_SETTINGS, ModelTaskMeta, \
+    ModelTaskMetaArchive, ModelTaskMetaState, purge_tasks, _object_chunks, \
+    _pk_chunks, _rank_by_object
+from .routing import use_primary
+from .sharding import get_databases
+
+logger = logging.getLogger('')
+
+
+class RetentionPolicy(object):
+    """
+    Retention rule for ready and skipped task metas.
+
+    A policy applies to the tasks of ``task_name`` and/or ``content_type``
+    (``'app_label.model'``), or to all tasks if neither is given. Of every
+    object the newest ``keep_last`` tasks are always kept; older ones are
+    removed once they have not been updated for ``max_age`` seconds. With
+    ``archive`` the removed rows are moved to ModelTaskMetaArchive.
+    """
+
+    def __init__(self, task_name=None, content_type=None, max_age=None,
+                 keep_last=None, archive=True):
+        if max_age is None and keep_last is None:
+            raise ValueError("Retention policy needs max_age or keep_last")
+        self.task_name = task_name
+        self.content_type = content_type
+        self.max_age = max_age
+        self.keep_last = keep_last
+        self.archive = archive
+
+    def __repr__(self):
+        return '<RetentionPolicy task_name=%r content_type=%r>' % (
+            self.task_name, self.content_type)
+
+    @property
+    def matches_all(self):
+        return not self.task_name and not self.content_type
+
+    def get_filter(self):
+        """
+        Return a Q matching the task metas this policy applies to.
+        """
+        q = Q()
+        if self.task_name:
+            q &= Q(task_name=self.task_name)
+        if self.content_type:
+            app_label, model = self.content_type.split('.')
+            q &= Q(content_type=ContentType.objects.get_by_natural_key(
+                app_label, model.lower()))
+        return q
+
+    def get_queryset(self, using=None):
+        return ModelTaskMeta.objects.using(using).filter(
+            self.get_filter(),
+            state__in=ModelTaskMetaState.READY_STATES +
+            (ModelTaskMetaState.IGNORED,))
+
+    def expired_pks(self, now=None, using=None, batch_size=500):
+        """
+        Yield the pks of the expired task metas in chunks, read with one
+        query per ``batch_size`` rows (or objects with ``keep_last``).
+        """
+        queryset = self.get_queryset(using)
+        cutoff = None
+        if self.max_age is not None:
+            cutoff = (now or timezone.now()) - timedelta(seconds=self.max_age)
+        if not self.keep_last:
+            for pks in _pk_chunks(queryset.filter(updated_at__lt=cutoff),
+                                  batch_size):
+                yield pks
+            return
+
+        for tasks in _object_chunks(queryset, batch_size):
+            pks = [pk for pk, rank, updated_at in _rank_by_object(tasks)
+                   if rank > self.keep_last and
+                   (cutoff is None or updated_at < cutoff)]
+            if pks:
+                yield pks
+
+
+def get_retention_policies():
+    return [RetentionPolicy(**policy) for policy in
+            DJCELERY_MODEL_SETTINGS.get('RETENTION_POLICIES', ())]
+
+
+def exclude_retained(queryset, policies=None):
+    """
+    Return ``queryset`` without the task metas retention policies apply to
+    (DJCELERY_MODEL['RETENTION_POLICIES'] by default), which are only
+    removed by the RetentionEngine.
+    """
+    if policies is None:
+        policies = get_retention_policies()
+    for policy in policies:
+        if policy.matches_all:
+            return queryset.none()
+        queryset = queryset.exclude(policy.get_filter())
+    return queryset
+
+
+class RetentionEngine(object):
+    """
+    Apply retention policies (DJCELERY_MODEL['RETENTION_POLICIES'], a list
+    of RetentionPolicy keyword dicts) in chunks of ``batch_size`` rows,
+    each moved in its own short transaction, sleeping ``pause`` seconds
+    between chunks.
+    """
+
+    def __init__(self, policies=None, batch_size=500, pause=0):
+        if policies is None:
+            policies = get_retention_policies()
+        self.policies = policies
+        self.batch_size = batch_size
+        self.pause = pause
+
+    @instrument('retention')
+    @use_primary()
+    def apply(self, dry_run=False):
+        if not dry_run and archive_partitioned():
+            ensure_archive_partitions()
+        stats = {}
+        for policy in self.policies:
+            expired = 0
+            for database in get_databases():
+                for pks in policy.expired_pks(using=database,
+                                              batch_size=self.batch_size):
+                    if not dry_run:
+                        for i in range(0, len(pks), self.batch_size):
+                            purge_tasks(pks[i:i + self.batch_size],
+                                        archive=policy.archive,
+                                        using=database)
+                            if self.pause:
+                                time.sleep(self.pause)
+                    expired += len(pks)
+            logger.info("%s: %d tasks expired" % (policy, expired))
+            stats[repr(policy)] = expired
+        return stats
+
+
+def archive_partitioned():
+    connection = connections[router.db_for_write(ModelTaskMetaArchive)]
+    return connection.vendor == 'postgresql' and \
+        DJCELERY_MODEL_SETTINGS.get('ARCHIVE_PARTITIONED', False)
+
+
+def _month_start(day, months=0):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return '%s_p%04d%02d' % (ModelTaskMetaArchive._meta.db_table,
+                             month.year, month.month)
+
+
+def ensure_archive_partitions(months_ahead=1):
+    """
+    Create the monthly partitions of the archive table for the current
+    and the next ``months_ahead`` months.
+    """
+    connection = connections[router.db_for_write(ModelTaskMetaArchive)]
+    table = ModelTaskMetaArchive._meta.db_table
+    today = timezone.now().date()
+    with connection.cursor() as cursor:
+        for months in range(months_ahead + 1):
+            month = _month_start(today, months)
+            cursor.execute(
+                'CREATE TABLE IF NOT EXISTS %s PARTITION OF %s '
+                'FOR VALUES FROM (%%s) TO (%%s)' % (
+                    connection.ops.quote_name(_partition_name(month)),
+                    connection.ops.quote_name(table)),
+                [month, _month_start(month, 1)])
+
+
+def drop_archive_partitions(max_age):
+    """
+    Drop the monthly archive partitions that only contain rows archived
+    more than ``max_age`` seconds ago.
+    """
+    connection = connections[router.db_for_write(ModelTaskMetaArchive)]
+    cutoff = (timezone.now() - timedelta(seconds=max_age)).date()
+    table = ModelTaskMetaArchive._meta.db_table
+    dropped = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON pg_inherits.inhparent = parent.oid '
+            'JOIN pg_class child ON pg_inherits.inhrelid = child.oid '
+            'WHERE parent.relname = %s', [table])
+        for (name,) in cursor.fetchall():
+            suffix = name[len(table) + 2:]
+            if not name.startswith(table + '_p') or len(suffix) != 6 or \
+                    not suffix.isdigit():
+                continue
+            month = date(int(suffix[:4]), int(suffix[4:]), 1)
+            if _month_start(month, 1) <= cutoff:
+                cursor.execute('DROP TABLE %s' %
+                               connection.ops.quote_name(name))
+                dropped.append(name)
+    return dropped
@@ -0,0 +1,137 @@
+from functools import wraps
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
+
+APP_LABEL = 'djcelery_model'
+
+_local = threading.local()
+
+
+def get_read_database():
+    """
+    Return the alias of the replica read-only paths are sent to
+    (DJCELERY_MODEL['READ_DATABASE']), or None if reads are not routed.
+    """
+    return DJCELERY_MODEL_SETTINGS.get('READ_DATABASE')
+
+
+class use_primary(object):
+    """
+    Send all djcelery_model reads of the current thread to the primary
+    database, usable as a context manager or decorator. Used by everything
+    that writes based on what it reads: enqueueing, the signal handlers,
+    pruning, cleanup and retention.
+    """
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with use_primary():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        _local.depth = getattr(_local, 'depth', 0) + 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.depth -= 1
+
+
+def primary_forced():
+    return getattr(_local, 'depth', 0) > 0
+
+
+def _pin_key(content_type_id, object_id):
+    return 'djcelery_model:pin:%s:%s' % (content_type_id, object_id)
+
+
+def pin_objects(pairs):
+    """
+    Read the tasks of the given ``(content_type_id, object_id)`` pairs from
+    the primary for DJCELERY_MODEL['READ_PIN_TIMEOUT'] seconds, so that
+    objects see their own new tasks before the replica caught up. Pins are
+    kept in the Django cache to be shared by all processes.
+    """
+    timeout = DJCELERY_MODEL_SETTINGS.get('READ_PIN_TIMEOUT', 5)
+    if not get_read_database() or not timeout:
+        return
+    keys = dict((_pin_key(*pair), 1) for pair in set(pairs))
+    if keys:
+        cache.set_many(keys, timeout)
+
+
+def is_pinned(pairs):
+    keys = [_pin_key(*pair) for pair in set(pairs)]
+    return bool(keys) and bool(cache.get_many(keys))
+
+
+def read_database(pairs=()):
+    """
+    Return the database to read the tasks of ``pairs`` from: the replica,
+    unless reads are forced to the primary or one of the objects is pinned,
+    or None if reads are not routed.
+    """
+    alias = get_read_database()
+    if not alias:
+        return None
+    if primary_forced() or is_pinned(pairs):
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+class TaskDatabaseRouter(object):
+    """
+    Database router sending reads of the djcelery_model tables to
+    DJCELERY_MODEL['READ_DATABASE'] and their writes to the default
+    database. Reads of objects pinned by apply_async() and reads within
+    use_primary() go to the default database, too. Objects of any model
+    read from the replica (e.g. by the task filters) are saved to the
+    default database.
+    """
+
+    def _get_pairs(self, hints):
+        instance = hints.get('instance')
+        if instance is None or instance.pk is None:
+            return ()
+        if instance._meta.app_label == APP_LABEL:
+            object_id = getattr(instance, 'object_id', None)
+            if object_id is None:
+                return ()
+            return [(instance.content_type_id, object_id)]
+        from django.contrib.contenttypes.models import ContentType
+        return [(ContentType.objects.get_for_model(instance).pk,
+                 instance.pk)]
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != APP_LABEL or not get_read_database():
+            return None
+        return read_database(self._get_pairs(hints))
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        alias = get_read_database()
+        instance = hints.get('instance')
+        if alias and instance is not None and instance._state.db == alias:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        alias = get_read_database()
+        if not alias:
+            return None
+        databases = (DEFAULT_DB_ALIAS, alias)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == APP_LABEL and db == get_read_database():
+            return False
+        return None
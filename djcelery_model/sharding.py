@@ -0,0 +1,203 @@
+from collections import OrderedDict
+import threading
+import zlib
+
+from django.conf import settings
+
+DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
+
+#: task header carrying the database alias of the task meta of a task
+SHARD_HEADER = 'djcelery_model_shard'
+
+
+def get_shards():
+    """
+    Return the aliases of the databases ModelTaskMeta rows are spread over
+    (DJCELERY_MODEL['SHARDS']), or an empty tuple if they are not sharded.
+    """
+    return tuple(DJCELERY_MODEL_SETTINGS.get('SHARDS', ()))
+
+
+def sharding_enabled():
+    return bool(get_shards())
+
+
+def get_databases():
+    """
+    Return the databases to scan for all task metas: every shard, or None
+    (the database chosen by the routers) if task metas are not sharded.
+    """
+    return get_shards() or (None,)
+
+
+def shard_for_object(content_type_id, object_id):
+    """
+    Return the shard holding the task metas of an object, or None if task
+    metas are not sharded. DJCELERY_MODEL['SHARD_KEY'] selects whether
+    objects are spread by ``'object'`` (the default) or by
+    ``'content_type'``, keeping all tasks of a model in one database.
+    """
+    shards = get_shards()
+    if not shards:
+        return None
+    if DJCELERY_MODEL_SETTINGS.get('SHARD_KEY', 'object') == 'content_type':
+        key = '%s' % content_type_id
+    else:
+        key = '%s:%s' % (content_type_id, object_id)
+    return shards[(zlib.crc32(key.encode('utf-8')) & 0xffffffff) %
+                  len(shards)]
+
+
+def shard_for_instance(instance):
+    if not sharding_enabled():
+        return None
+    from django.contrib.contenttypes.models import ContentType
+    return shard_for_object(ContentType.objects.get_for_model(instance).pk,
+                            instance.pk)
+
+
+def shard_of(obj):
+    """
+    Return the shard a ModelTaskMeta queryset or instance belongs to, or
+    None if task metas are not sharded.
+    """
+    if not sharding_enabled():
+        return None
+    if hasattr(obj, '_state'):
+        return obj._state.db
+    return obj.db
+
+
+def group_objects(content_type_id, object_ids):
+    """
+    Group ``object_ids`` by the shard of their task metas.
+    """
+    groups = {}
+    for object_id in object_ids:
+        groups.setdefault(shard_for_object(content_type_id, object_id),
+                          []).append(object_id)
+    return groups
+
+
+class ShardHints(object):
+    """
+    Process-local map of task ids to the shard of their task meta, learned
+    from the SHARD_HEADER of published and executed tasks. Only the
+    ``max_size`` most recently seen tasks are kept.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._shards = OrderedDict()
+
+    def set(self, task_id, shard):
+        if shard not in get_shards():
+            return
+        with self._lock:
+            self._shards.pop(task_id, None)
+            self._shards[task_id] = shard
+            while len(self._shards) > self.max_size:
+                self._shards.popitem(last=False)
+
+    def get(self, task_id):
+        with self._lock:
+            return self._shards.get(task_id)
+
+
+shard_hints = ShardHints()
+
+
+def group_task_ids(task_ids):
+    """
+    Group ``task_ids`` by the shard of their task meta. Tasks without a
+    shard hint are looked up in every shard.
+    """
+    task_ids = list(task_ids)
+    shards = get_shards()
+    if not shards:
+        return {None: task_ids}
+    groups = {}
+    unknown = []
+    for task_id in task_ids:
+        shard = shard_hints.get(task_id)
+        if shard is None:
+            unknown.append(task_id)
+        else:
+            groups.setdefault(shard, []).append(task_id)
+    if unknown:
+        for shard in shards:
+            groups.setdefault(shard, []).extend(unknown)
+    return groups
+
+
+def get_shard_hint(request=None, headers=None):
+    """
+    Return the shard named by the SHARD_HEADER of a task ``request`` (a
+    task context or worker request) or message ``headers``.
+    """
+    if headers is None and request is not None:
+        shard = getattr(request, SHARD_HEADER, None)
+        if shard is not None:
+            return shard
+        headers = getattr(request, 'headers', None) or \
+            getattr(request, 'request_dict', None)
+    if headers:
+        return headers.get(SHARD_HEADER)
+    return None
+
+
+def shard_options(task_id, shard, options):
+    """
+    Return the apply_async ``options`` of ``task_id`` with the header
+    naming its ``shard``, which is also remembered for this process.
+    """
+    if shard is None:
+        return options
+    shard_hints.set(task_id, shard)
+    headers = dict(options.get('headers') or {})
+    headers[SHARD_HEADER] = shard
+    return dict(options, headers=headers)
+
+
+class TaskShardRouter(object):
+    """
+    Database router sending the task metas of an object to its shard when
+    the query is made for an object (``instance.tasks``) or a task meta
+    (saving it). All other task meta queries are made on every shard by
+    djcelery_model itself. Needs to come before other routers handling
+    djcelery_model, e.g. TaskDatabaseRouter.
+    """
+
+    def _is_task_meta(self, model):
+        return model._meta.app_label == 'djcelery_model' and \
+            model._meta.model_name == 'modeltaskmeta'
+
+    def _get_shard(self, hints):
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if self._is_task_meta(instance.__class__):
+            if instance.object_id is None:
+                return None
+            return shard_for_object(instance.content_type_id,
+                                    instance.object_id)
+        if instance.pk is None:
+            return None
+        return shard_for_instance(instance)
+
+    def db_for_read(self, model, **hints):
+        if not self._is_task_meta(model):
+            return None
+        return self._get_shard(hints)
+
+    def db_for_write(self, model, **hints):
+        if not self._is_task_meta(model):
+            return None
+        return self._get_shard(hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_task_meta(obj1.__class__) or \
+                self._is_task_meta(obj2.__class__):
+            return True
+        return None
@@ -1,3 +1,12 @@
+import threading
+import time
+
+from django.conf import settings
+
+from .instrumentation import instrument
+
+DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
+
 WORKER_OFFLINE = 0
 WORKER_READY = 1
 WORKER_BUSY = 2
@@ -11,13 +20,13 @@ WORKER_STATUS_CHOICES = (
 )
 WORKER_ERROR_STATUSES = (WORKER_OFFLINE, WORKER_ERROR)
 
+WORKER_STATUS_DISPLAY = dict(WORKER_STATUS_CHOICES)
+
 def get_worker_status_display(status):
-    for status_code, status_display in WORKER_STATUS_CHOICES:
-        if status_code == status:
-            return status_display
-    return None
+    return WORKER_STATUS_DISPLAY.get(status)
 
 
+@instrument('worker_status_probe')
 def get_worker_status():
     status_message = None
     try:
@@ -48,3 +57,93 @@ def get_worker_status():
     if status_message:
         d['status_message'] = status_message
     return d
+
+
+class WorkerStatusCache(object):
+    """
+    Process-wide cache for the result of get_worker_status().
+
+    A cached status is served for ``ttl`` seconds. Once it expires the stale
+    status is still served while a single background thread refreshes it;
+    only a status older than twice the TTL (or no status at all) is probed
+    synchronously, and concurrent callers wait for that one probe.
+    """
+
+    def __init__(self, ttl=None, probe=get_worker_status):
+        if ttl is None:
+            ttl = DJCELERY_MODEL_SETTINGS.get('WORKER_STATUS_TTL', 30)
+        self.ttl = ttl
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._status = None
+        self._fetched_at = 0
+        self._refreshing = False
+
+    def get(self):
+        if self.ttl <= 0:
+            return self.probe()
+        status, age = self._status, time.time() - self._fetched_at
+        if status is None or age >= 2 * self.ttl:
+            return self._refresh_sync()
+        if age >= self.ttl:
+            self._refresh_async()
+        return status
+
+    def set(self, status):
+        with self._lock:
+            self._status = status
+            self._fetched_at = time.time()
+
+    def mark_offline(self, status_message=None):
+        """
+        Flip the cached status to offline, e.g. after a failed publish.
+        The status is marked stale so the next read triggers a refresh.
+        """
+        status = {
+            'status_code': WORKER_OFFLINE,
+            'status': get_worker_status_display(WORKER_OFFLINE),
+        }
+        if status_message:
+            status['status_message'] = status_message
+        with self._lock:
+            self._status = status
+            self._fetched_at = time.time() - self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self._status = None
+            self._fetched_at = 0
+
+    def _refresh_sync(self):
+        with self._probe_lock:
+            if self._status is not None and \
+                    time.time() - self._fetched_at < self.ttl:
+                return self._status
+            self.set(self.probe())
+            return self._status
+
+    def _refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._refresh_background,
+                                  name='djcelery-model-worker-status')
+        thread.daemon = True
+        thread.start()
+
+    def _refresh_background(self):
+        try:
+            with self._probe_lock:
+                self.set(self.probe())
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+worker_status_cache = WorkerStatusCache()
+
+
+def get_cached_worker_status():
+    return worker_status_cache.get()
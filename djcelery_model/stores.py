@@ -0,0 +1,156 @@
+from django.conf import settings
+
+try:
+    from django.utils.module_loading import import_string
+except ImportError:
+    from django.utils.module_loading import import_by_path as import_string
+
+from .writer import state_writer
+
+DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
+
+
+class DatabaseStateStore(object):
+    """
+    Keeps every task state transition in the ModelTaskMeta table.
+    """
+
+    #: whether running states are kept outside the ModelTaskMeta table
+    overlay = False
+
+    def persists(self, state):
+        """
+        Return whether ``state`` is written to the ModelTaskMeta table.
+        """
+        return True
+
+    def set_state(self, task_id, state):
+        from .models import ModelTaskMetaState, set_task_state
+        if state == ModelTaskMetaState.PENDING:
+            # written at once, so that a PENDING state buffered after
+            # publishing can never overwrite the state set by a worker
+            set_task_state(task_id, state)
+        else:
+            state_writer.set_state(task_id, state)
+
+    def set_states(self, task_ids, state):
+        from .models import set_tasks_state
+        set_tasks_state(task_ids, state)
+
+    def delete(self, task_id):
+        state_writer.delete(task_id)
+
+    def get_states(self, task_ids):
+        return {}
+
+    def load_states(self, taskmetas):
+        """
+        Update the in-memory ``state`` of running ``taskmetas`` from the
+        store.
+        """
+        if not self.overlay:
+            return
+        running = [t for t in taskmetas if not self.persists(t.state)]
+        states = self.get_states([t.task_id for t in running])
+        for t in running:
+            t.state = states.get(t.task_id, t.state)
+
+    def filter_states(self, queryset, states):
+        """
+        Filter a ModelTaskMeta ``queryset`` on tasks in ``states``.
+        """
+        return queryset.filter(state__in=states)
+
+
+class RedisStateStore(DatabaseStateStore):
+    """
+    Keeps the running states (STARTED, RETRY) of tasks in Redis and writes
+    only ready states and deletions through to the ModelTaskMeta table,
+    where running tasks stay in the PENDING state they are created with.
+
+    ``client`` is a redis-py compatible client (e.g. a
+    ``fakeredis.FakeStrictRedis`` in tests); by default one is created for
+    DJCELERY_MODEL['STATE_STORE_URL']. Keys expire after ``ttl`` seconds,
+    after which the state stored in the table (and reconciliation with the
+    result backend) applies again.
+    """
+
+    overlay = True
+
+    def __init__(self, client=None, url=None, prefix='djcelery_model:state:',
+                 ttl=86400):
+        if client is None:
+            import redis
+            client = redis.StrictRedis.from_url(
+                url or DJCELERY_MODEL_SETTINGS.get(
+                    'STATE_STORE_URL', 'redis://localhost:6379/0'))
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get_key(self, task_id):
+        return '%s%s' % (self.prefix, task_id)
+
+    def persists(self, state):
+        from .models import ModelTaskMetaState
+        return state not in ModelTaskMetaState.RUNNING_STATES
+
+    def set_state(self, task_id, state):
+        self.set_states([task_id], state)
+
+    def set_states(self, task_ids, state):
+        from .models import ModelTaskMetaState
+        if self.persists(state):
+            for task_id in task_ids:
+                state_writer.set_state(task_id, state)
+            self.client.delete(*[self.get_key(t) for t in task_ids])
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for task_id in task_ids:
+            # PENDING (published) must not overwrite a state set by a worker
+            pipe.set(self.get_key(task_id), state, ex=self.ttl,
+                     nx=state == ModelTaskMetaState.PENDING)
+        pipe.execute()
+
+    def delete(self, task_id):
+        state_writer.delete(task_id)
+        self.client.delete(self.get_key(task_id))
+
+    def get_states(self, task_ids):
+        task_ids = list(task_ids)
+        if not task_ids:
+            return {}
+        values = self.client.mget([self.get_key(t) for t in task_ids])
+        return dict((task_id, int(value))
+                    for task_id, value in zip(task_ids, values)
+                    if value is not None)
+
+    def filter_states(self, queryset, states):
+        from django.db.models import Q
+        from .models import ModelTaskMetaState
+        running = set(ModelTaskMetaState.RUNNING_STATES)
+        wanted = set(states) & running
+        if not wanted or wanted == running:
+            return queryset.filter(state__in=states)
+        rows = list(queryset.filter(
+            state__in=ModelTaskMetaState.RUNNING_STATES,
+        ).values_list('task_id', 'state'))
+        stored = self.get_states([task_id for task_id, state in rows])
+        task_ids = [task_id for task_id, state in rows
+                    if stored.get(task_id, state) in wanted]
+        q = Q(task_id__in=task_ids)
+        others = set(states) - running
+        if others:
+            q |= Q(state__in=others)
+        return queryset.filter(q)
+
+
+def _get_state_store():
+    store = DJCELERY_MODEL_SETTINGS.get('STATE_STORE')
+    if store:
+        return import_string(store)(
+            **DJCELERY_MODEL_SETTINGS.get('STATE_STORE_OPTIONS', {}))
+    return DatabaseStateStore()
+
+
+state_store = _get_state_store()
@@ -0,0 +1,23 @@
+from celery import shared_task
+
+from .pruning import prune_tasks as _prune_tasks
+from .retention import RetentionEngine
+
+
+@shared_task(ignore_result=True)
+def prune_tasks(pending_task_timeout=0, non_block_ui_timeout=0,
+                batch_size=1000):
+    return _prune_tasks(pending_task_timeout, non_block_ui_timeout,
+                        batch_size)
+
+
+@shared_task(ignore_result=True)
+def apply_retention(batch_size=500, pause=0):
+    return RetentionEngine(batch_size=batch_size, pause=pause).apply()
+
+
+@shared_task(ignore_result=True)
+def relay_outbox(batch_size=100, limit=None):
+    from .outbox import OutboxRelay
+    return OutboxRelay(batch_size=batch_size,
+                       publish_on_commit=False).drain(limit)
@@ -0,0 +1,10 @@
+"""
+Tests of django-celery-model, run with their settings:
+
+    django-admin test djcelery_model \
+        --settings=djcelery_model.tests.settings
+
+The Redis result backend tests use the server at
+DJCELERY_MODEL_TEST_REDIS_URL and are skipped if it is not set, the
+RedisStateStore tests need fakeredis.
+"""
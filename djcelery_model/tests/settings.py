@@ -0,0 +1,25 @@
+"""
+Django settings for the django-celery-model tests: the benchmark settings
+with a replica and two shards, all in-memory SQLite databases. Replica
+reads and sharding are off unless a test turns them on.
+"""
+from benchmarks.settings import *  # noqa
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+for _alias in ('replica', 'shard0', 'shard1'):
+    DATABASES[_alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+
+DATABASE_ROUTERS = []
+
+DJCELERY_MODEL = {
+    'WORKER_STATUS_TTL': 24 * 60 * 60,
+    'PRUNE_ON_STATUS': False,
+}
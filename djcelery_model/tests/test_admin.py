@@ -0,0 +1,43 @@
+import uuid
+
+from django.test import TestCase
+
+from ..admin import TaskModelAdmin
+from ..models import ModelTaskMeta, ModelTaskMetaState
+
+
+class TaskModelAdminTest(TestCase):
+
+    def setUp(self):
+        from django.contrib import admin
+        from django.contrib.auth.models import User
+        from django.test import RequestFactory
+        from benchmarks.benchapp.models import BenchItem
+        self.request = RequestFactory().get('/')
+        self.request.user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'admin')
+        self.model_admin = TaskModelAdmin(BenchItem, admin.site)
+        self.model_admin.message_user = \
+            lambda request, message: self.messages.append(message)
+        self.messages = []
+        self.item = BenchItem.objects.create(name='item')
+        ModelTaskMeta.objects.create(
+            content_object=self.item, task_id=uuid.uuid4().hex,
+            task_name='benchmarks.noop', state=ModelTaskMetaState.FAILURE)
+
+    def test_retry_action_needs_retry_tasks(self):
+        self.assertNotIn('retry_failed_tasks',
+                         self.model_admin.get_actions(self.request))
+        self.model_admin.retry_tasks = ('benchmarks.noop',)
+        self.assertIn('retry_failed_tasks',
+                      self.model_admin.get_actions(self.request))
+
+    def test_unlisted_tasks_are_not_retried(self):
+        from benchmarks.benchapp.models import BenchItem
+        self.model_admin.retry_tasks = ('benchmarks.other',)
+        self.model_admin.retry_failed_tasks(self.request,
+                                            BenchItem.objects.all())
+        self.assertEqual(self.messages, [
+            "Task benchmarks.noop is not in retry_tasks, not retried.",
+            "0 task(s) queued again.",
+        ])
@@ -0,0 +1,44 @@
+import asyncio
+import uuid
+
+from django.test import TransactionTestCase, override_settings
+
+from ..aio import aget_task_status
+from ..models import ModelTaskMeta, ModelTaskMetaState
+from .utils import djcelery_model_settings
+
+
+@override_settings(
+    DATABASE_ROUTERS=['djcelery_model.routing.TaskDatabaseRouter'])
+class AsyncTaskStatusTest(TransactionTestCase):
+    # the replica is a separate, empty database: everything read from it is
+    # missing from the status
+    multi_db = True
+    databases = '__all__'
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        self.item = BenchItem.objects.create(name='item')
+        self.task = ModelTaskMeta.objects.create(
+            content_object=self.item, task_id=uuid.uuid4().hex,
+            state=ModelTaskMetaState.SUCCESS)
+
+    def get_status(self):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(aget_task_status(self.item))
+        finally:
+            loop.close()
+
+    def test_status_after_pruning_is_read_from_the_primary(self):
+        with djcelery_model_settings(READ_DATABASE='replica',
+                                     PRUNE_ON_STATUS=True):
+            status = self.get_status()
+        self.assertEqual(status['last_ready_task']['task_id'],
+                         self.task.task_id)
+
+    def test_status_without_pruning_is_read_from_the_replica(self):
+        with djcelery_model_settings(READ_DATABASE='replica',
+                                     PRUNE_ON_STATUS=False):
+            status = self.get_status()
+        self.assertNotIn('last_ready_task', status)
@@ -0,0 +1,83 @@
+import uuid
+
+from celery import states
+from django.test import TestCase
+
+from ..models import ModelTaskMeta, ModelTaskMetaState, claim_task, \
+    handle_task_postrun, handle_task_revoked, make_dedup_key
+from .utils import set_workers_ready
+
+
+class Request(object):
+    headers = None
+
+    def __init__(self, task_id):
+        self.id = task_id
+
+
+class DedupTest(TestCase):
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        from benchmarks.celery_app import noop
+        set_workers_ready()
+        self.item = BenchItem.objects.create(name='item')
+        self.task = noop
+
+    def apply_async(self, *args, **kwargs):
+        return self.item.apply_async(self.task, *args, **kwargs)
+
+    def test_duplicate_returns_the_running_task(self):
+        first = self.apply_async(1, dedup=True)
+        second = self.apply_async(2, dedup=True)
+        self.assertEqual(second.id, first.id)
+        self.assertEqual(self.item.tasks.count(), 1)
+
+    def test_duplicate_arguments(self):
+        first = self.apply_async(1, dedup='args')
+        self.assertEqual(self.apply_async(1, dedup='args').id, first.id)
+        self.assertNotEqual(self.apply_async(2, dedup='args').id, first.id)
+        self.assertEqual(self.item.tasks.count(), 2)
+
+    def test_tasks_without_dedup_are_queued(self):
+        first = self.apply_async(dedup=True)
+        self.assertNotEqual(self.apply_async().id, first.id)
+        self.assertEqual(self.item.tasks.count(), 2)
+
+    def assert_released(self, result):
+        self.assertIsNone(ModelTaskMeta.objects.filter(
+            task_id=result.id, dedup_key__isnull=False).first())
+        self.assertNotEqual(self.apply_async(dedup=True).id, result.id)
+
+    def test_released_on_success(self):
+        result = self.apply_async(dedup=True)
+        handle_task_postrun(task_id=result.id, state=states.SUCCESS)
+        self.assertEqual(ModelTaskMeta.objects.get(task_id=result.id).state,
+                         ModelTaskMetaState.SUCCESS)
+        self.assert_released(result)
+
+    def test_released_on_failure(self):
+        result = self.apply_async(dedup=True)
+        handle_task_postrun(task_id=result.id, state=states.FAILURE)
+        self.assertEqual(ModelTaskMeta.objects.get(task_id=result.id).state,
+                         ModelTaskMetaState.FAILURE)
+        self.assert_released(result)
+
+    def test_released_on_revoke(self):
+        result = self.apply_async(dedup=True)
+        handle_task_revoked(request=Request(result.id))
+        self.assert_released(result)
+
+    def test_concurrent_claim(self):
+        # another process claimed the key after this one built its task meta
+        taskmeta = ModelTaskMeta(task_id=uuid.uuid4().hex,
+                                 content_object=self.item,
+                                 task_name=self.task.name)
+        taskmeta.dedup_key = make_dedup_key(taskmeta)
+        holder = ModelTaskMeta.objects.create(
+            task_id=uuid.uuid4().hex, content_object=self.item,
+            task_name=self.task.name, dedup_key=taskmeta.dedup_key)
+
+        self.assertEqual(claim_task(taskmeta), holder)
+        self.assertIsNone(taskmeta.pk)
+        self.assertEqual(self.item.tasks.count(), 1)
@@ -0,0 +1,42 @@
+import uuid
+
+from django.test import TestCase
+
+from ..models import ModelTaskMeta, ModelTaskMetaState
+
+
+class TaskFilterTest(TestCase):
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        self.manager = BenchItem.objects
+        self.running = BenchItem.objects.create(name='running')
+        self.ready = BenchItem.objects.create(name='ready')
+        self.idle = BenchItem.objects.create(name='idle')
+        for item, states in ((self.running, (ModelTaskMetaState.STARTED,
+                                             ModelTaskMetaState.PENDING)),
+                             (self.ready, (ModelTaskMetaState.SUCCESS,
+                                           ModelTaskMetaState.FAILURE))):
+            for state in states:
+                ModelTaskMeta.objects.create(
+                    content_object=item, task_id=uuid.uuid4().hex,
+                    state=state)
+
+    def assert_items(self, queryset, items):
+        # every object once, even with several matching tasks
+        self.assertEqual(sorted(queryset.values_list('pk', flat=True)),
+                         sorted(item.pk for item in items))
+
+    def test_with_tasks(self):
+        self.assert_items(self.manager.with_tasks(),
+                          [self.running, self.ready])
+        self.assert_items(self.manager.with_running_tasks(), [self.running])
+        self.assert_items(self.manager.with_ready_tasks(), [self.ready])
+        self.assert_items(self.manager.with_failed_tasks(), [self.ready])
+
+    def test_without_tasks(self):
+        self.assert_items(self.manager.without_tasks(), [self.idle])
+        self.assert_items(self.manager.without_running_tasks(),
+                          [self.ready, self.idle])
+        self.assert_items(self.manager.without_successful_tasks(),
+                          [self.running, self.idle])
@@ -0,0 +1,94 @@
+import json
+import uuid
+from io import StringIO
+
+from celery import signals
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from ..models import ModelTaskMeta, ModelTaskOutbox
+from ..outbox import outbox_relay
+from .utils import djcelery_model_settings
+
+
+class PublishRecorder(object):
+
+    def __init__(self):
+        self.task_ids = []
+
+    def __call__(self, sender=None, body=None, **kwargs):
+        self.task_ids.append(body['id'])
+
+    def connect(self, testcase):
+        signals.after_task_publish.connect(self, weak=False)
+        testcase.addCleanup(signals.after_task_publish.disconnect, self)
+
+
+class OutboxTest(TransactionTestCase):
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        from benchmarks.celery_app import noop
+        self.item = BenchItem.objects.create(name='item')
+        self.task = noop
+        self.published = PublishRecorder()
+        self.published.connect(self)
+        self.settings = djcelery_model_settings(OUTBOX=True)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def wait_for_relay(self):
+        with outbox_relay._lock:
+            thread = outbox_relay._thread
+        if thread is not None:
+            thread.join(5)
+
+    def test_rollback_publishes_nothing(self):
+        try:
+            with transaction.atomic():
+                self.item.apply_async(self.task, 1)
+                raise ValueError
+        except ValueError:
+            pass
+        self.wait_for_relay()
+        self.assertFalse(ModelTaskOutbox.objects.exists())
+        self.assertFalse(ModelTaskMeta.objects.exists())
+        self.assertEqual(self.published.task_ids, [])
+
+    def test_commit_publishes(self):
+        with transaction.atomic():
+            result = self.item.apply_async(self.task, 1)
+            self.assertTrue(ModelTaskOutbox.objects.filter(
+                task_id=result.id).exists())
+            self.assertEqual(self.published.task_ids, [])
+        self.wait_for_relay()
+        self.assertEqual(self.published.task_ids, [result.id])
+        self.assertFalse(ModelTaskOutbox.objects.exists())
+
+
+class OutboxCommandTest(TestCase):
+
+    def setUp(self):
+        from benchmarks.celery_app import noop
+        self.published = PublishRecorder()
+        self.published.connect(self)
+        self.task_ids = [uuid.uuid4().hex for _ in range(3)]
+        for task_id in self.task_ids:
+            ModelTaskOutbox.objects.create(
+                task_id=task_id, task_name=noop.name,
+                args=json.dumps([1]), kwargs=json.dumps({}))
+
+    def drain(self):
+        stdout = StringIO()
+        call_command('djcelery_model_outbox', once=True, batch_size=2,
+                     stdout=stdout)
+        return stdout.getvalue().strip()
+
+    def test_rows_are_published_once_and_deleted(self):
+        self.assertEqual(self.drain(), 'published: 3')
+        self.assertEqual(self.published.task_ids, self.task_ids)
+        self.assertFalse(ModelTaskOutbox.objects.exists())
+
+        self.assertEqual(self.drain(), 'published: 0')
+        self.assertEqual(self.published.task_ids, self.task_ids)
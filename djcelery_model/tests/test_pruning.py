@@ -0,0 +1,56 @@
+import uuid
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import ModelTaskMeta, ModelTaskMetaArchive, \
+    ModelTaskMetaState
+from ..pruning import TaskPruner
+from ..retention import RetentionEngine, RetentionPolicy
+
+
+class ReadyTaskRemovalTest(TestCase):
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        now = timezone.now()
+        for i in range(2):
+            item = BenchItem.objects.create(name='item %d' % i)
+            for age in range(3):
+                task = ModelTaskMeta.objects.create(
+                    content_object=item, task_id=uuid.uuid4().hex,
+                    state=ModelTaskMetaState.SUCCESS)
+                ModelTaskMeta.objects.filter(pk=task.pk).update(
+                    updated_at=now - timedelta(days=age))
+
+    def test_pruner_keeps_last_ready_task(self):
+        pruner = TaskPruner(batch_size=1)
+        pruner.retention_policies = []
+        deleted = pruner.delete_old_ready(ModelTaskMeta.objects.all())
+        self.assertEqual(deleted, 4)
+        self.assertEqual(ModelTaskMeta.objects.count(), 2)
+
+    def test_prune(self):
+        stats = TaskPruner(batch_size=1).prune()
+        self.assertEqual(stats['old_ready'], 4)
+        self.assertEqual(stats['skipped'], 0)
+
+    def test_pruner_leaves_retained_tasks(self):
+        policy = RetentionPolicy(keep_last=2)
+        pruner = TaskPruner(batch_size=1)
+        pruner.retention_policies = [policy]
+        self.assertEqual(
+            pruner.delete_old_ready(ModelTaskMeta.objects.all()), 0)
+
+        stats = RetentionEngine([policy], batch_size=1).apply()
+        self.assertEqual(stats[repr(policy)], 2)
+        self.assertEqual(ModelTaskMeta.objects.count(), 4)
+        self.assertEqual(ModelTaskMetaArchive.objects.count(), 2)
+
+    def test_retention_max_age(self):
+        policy = RetentionPolicy(max_age=12 * 3600, archive=False)
+        stats = RetentionEngine([policy], batch_size=1).apply()
+        self.assertEqual(stats[repr(policy)], 4)
+        self.assertEqual(ModelTaskMeta.objects.count(), 2)
+        self.assertEqual(ModelTaskMetaArchive.objects.count(), 0)
@@ -0,0 +1,30 @@
+from django.test import SimpleTestCase
+
+from ..pubsub import LocalPubSub
+
+
+class LocalPubSubTest(SimpleTestCase):
+
+    def test_channels_are_bounded(self):
+        pubsub = LocalPubSub(max_channels=2)
+        for channel in ('a', 'b', 'c', 'b'):
+            pubsub.publish(channel)
+        self.assertEqual(pubsub.version('a'), 0)
+        self.assertEqual(pubsub.version('b'), 2)
+        self.assertEqual(pubsub.version('c'), 1)
+
+    def test_waited_on_channels_are_kept(self):
+        pubsub = LocalPubSub(max_channels=1)
+        pubsub.publish('a')
+        pubsub._waiters['a'] = 1  # as during wait('a', ...)
+        pubsub.publish('b')
+        self.assertEqual(pubsub.version('a'), 1)
+        self.assertEqual(pubsub.version('b'), 1)
+        del pubsub._waiters['a']
+
+    def test_wait(self):
+        pubsub = LocalPubSub()
+        self.assertEqual(pubsub.wait('a', 0, 0.01), 0)
+        pubsub.publish('a')
+        self.assertEqual(pubsub.wait('a', 0, 1), 1)
+        self.assertEqual(pubsub._waiters, {})
@@ -0,0 +1,127 @@
+import os
+import unittest
+import uuid
+
+from celery import states
+from celery.backends.cache import CacheBackend
+from django.test import SimpleTestCase, TestCase
+
+from ..models import ModelTaskMeta, ModelTaskMetaState
+from ..reconcile import TaskReconciler, remap_failed_tasks
+from ..results import get_task_metas
+
+REDIS_URL = os.environ.get('DJCELERY_MODEL_TEST_REDIS_URL')
+
+
+class GetTaskMetasMixin(object):
+
+    def get_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        from benchmarks.celery_app import app
+        self.app = app
+        self.backend = self.get_backend()
+
+    def test_stored_and_missing_results(self):
+        done, failed, missing = [uuid.uuid4().hex for _ in range(3)]
+        self.backend.store_result(done, 42, states.SUCCESS)
+        self.backend.store_result(failed, KeyError('key'), states.FAILURE)
+
+        metas = get_task_metas([done, failed, missing], backend=self.backend)
+
+        self.assertEqual(set(metas), set([done, failed, missing]))
+        self.assertEqual(metas[done]['status'], states.SUCCESS)
+        self.assertEqual(metas[done]['result'], 42)
+        self.assertEqual(metas[failed]['status'], states.FAILURE)
+        self.assertIsInstance(metas[failed]['result'], KeyError)
+        self.assertEqual(metas[missing]['status'], states.PENDING)
+        self.assertIsNone(metas[missing]['result'])
+
+    def test_no_task_ids(self):
+        self.assertEqual(get_task_metas([], backend=self.backend), {})
+
+
+class CacheBackendGetTaskMetasTest(GetTaskMetasMixin, SimpleTestCase):
+
+    def get_backend(self):
+        return CacheBackend(app=self.app, backend='memory')
+
+
+@unittest.skipUnless(REDIS_URL, 'DJCELERY_MODEL_TEST_REDIS_URL is not set')
+class RedisBackendGetTaskMetasTest(GetTaskMetasMixin, SimpleTestCase):
+
+    def get_backend(self):
+        from celery.backends.redis import RedisBackend
+        return RedisBackend(app=self.app, url=REDIS_URL)
+
+
+class UnreadableBackend(object):
+
+    def get_task_meta(self, task_id):
+        raise IOError('backend unavailable')
+
+
+class TaskReconcilerTest(SimpleTestCase):
+
+    def setUp(self):
+        from benchmarks.celery_app import app
+        self.backend = CacheBackend(app=app, backend='memory')
+
+    def test_task_without_meta_is_pending(self):
+        task = ModelTaskMeta(task_id=uuid.uuid4().hex,
+                             state=ModelTaskMetaState.STARTED)
+        result = TaskReconciler(self.backend).reconcile([task], save=False)
+        self.assertEqual(result.failed, [])
+        self.assertEqual(task.state, ModelTaskMetaState.PENDING)
+
+    def test_task_with_meta(self):
+        task = ModelTaskMeta(task_id=uuid.uuid4().hex,
+                             state=ModelTaskMetaState.STARTED)
+        self.backend.store_result(task.task_id, None, states.SUCCESS)
+        result = TaskReconciler(self.backend).reconcile([task], save=False)
+        self.assertEqual(result.failed, [])
+        self.assertEqual(task.state, ModelTaskMetaState.SUCCESS)
+
+    def test_unreadable_meta_is_failed(self):
+        task = ModelTaskMeta(task_id=uuid.uuid4().hex,
+                             state=ModelTaskMetaState.STARTED)
+        reconciler = TaskReconciler(UnreadableBackend())
+        result = reconciler.reconcile([task], save=False)
+        self.assertEqual(result.failed, [task])
+        self.assertEqual(task.state, ModelTaskMetaState.STARTED)
+
+
+class RemapFailedTasksTest(TestCase):
+
+    def setUp(self):
+        from benchmarks.celery_app import app
+        from benchmarks.benchapp.models import BenchItem
+        self.backend = CacheBackend(app=app, backend='memory')
+        self.item = BenchItem.objects.create(name='item')
+
+    def create_task(self, backend_state=None):
+        task = ModelTaskMeta.objects.create(
+            content_object=self.item, task_id=uuid.uuid4().hex,
+            state=ModelTaskMetaState.FAILURE)
+        if backend_state is not None:
+            self.backend.store_result(task.task_id, None, backend_state)
+        return task
+
+    def test_failed_tasks_get_their_backend_state(self):
+        revoked = self.create_task(states.REVOKED)
+        rejected = self.create_task(states.REJECTED)
+        failed = self.create_task(states.FAILURE)
+        unknown = self.create_task('UNREGISTERED')
+        missing = self.create_task()
+
+        self.assertEqual(remap_failed_tasks(batch_size=2,
+                                            backend=self.backend), 2)
+
+        def state(task):
+            return ModelTaskMeta.objects.get(pk=task.pk).state
+
+        self.assertEqual(state(revoked), ModelTaskMetaState.REVOKED)
+        self.assertEqual(state(rejected), ModelTaskMetaState.REJECTED)
+        for task in (failed, unknown, missing):
+            self.assertEqual(state(task), ModelTaskMetaState.FAILURE)
@@ -0,0 +1,159 @@
+import uuid
+from datetime import timedelta
+
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ..cleanup import cleanup_tasks
+from ..models import ModelTaskMeta, ModelTaskMetaState, handle_task_prerun
+from ..pruning import TaskPruner
+from ..sharding import SHARD_HEADER, shard_for_instance, shard_hints
+from .utils import djcelery_model_settings, set_workers_ready
+
+SHARDS = ('shard0', 'shard1')
+
+
+class Request(object):
+
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class Task(object):
+
+    def __init__(self, headers=None):
+        self.request = Request(headers or {})
+
+
+@override_settings(
+    DATABASE_ROUTERS=['djcelery_model.sharding.TaskShardRouter'])
+class ShardingTest(TestCase):
+    multi_db = True
+    databases = '__all__'
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        from benchmarks.celery_app import noop
+        self.settings = djcelery_model_settings(SHARDS=SHARDS)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        set_workers_ready()
+        self.model = BenchItem
+        self.task = noop
+        # an item in every shard
+        self.items = {}
+        while len(self.items) < len(SHARDS):
+            item = BenchItem.objects.create(name='item')
+            self.items.setdefault(shard_for_instance(item), item)
+
+    def other_shard(self, shard):
+        return [s for s in SHARDS if s != shard][0]
+
+    def create_task(self, shard, state, **kwargs):
+        return ModelTaskMeta.objects.using(shard).create(
+            content_object=self.items[shard], task_id=uuid.uuid4().hex,
+            state=state, **kwargs)
+
+    def test_apply_async_writes_to_the_shard_of_the_instance(self):
+        for shard, item in self.items.items():
+            result = item.apply_async(self.task)
+            self.assertTrue(ModelTaskMeta.objects.using(shard).filter(
+                task_id=result.id).exists())
+            self.assertFalse(ModelTaskMeta.objects.using(
+                self.other_shard(shard)).filter(task_id=result.id).exists())
+            self.assertEqual(shard_hints.get(result.id), shard)
+            self.assertEqual([t.task_id for t in item.tasks.all()],
+                             [result.id])
+
+    def test_apply_async_many_spreads_task_metas(self):
+        results = self.model.objects.apply_async_many(
+            self.task, instances=self.items.values())
+        self.assertEqual(len(results), len(SHARDS))
+        for shard, item in self.items.items():
+            taskmeta = ModelTaskMeta.objects.using(shard).get()
+            self.assertEqual(taskmeta.object_id, item.pk)
+
+    def prerun(self, taskmeta, headers=None):
+        captured = dict((shard, CaptureQueriesContext(connections[shard]))
+                        for shard in SHARDS)
+        for context in captured.values():
+            context.__enter__()
+        try:
+            handle_task_prerun(task_id=taskmeta.task_id,
+                               task=Task(headers))
+        finally:
+            for context in captured.values():
+                context.__exit__(None, None, None)
+        taskmeta.refresh_from_db()
+        self.assertEqual(taskmeta.state, ModelTaskMetaState.STARTED)
+        return dict((shard, len(context))
+                    for shard, context in captured.items())
+
+    def test_handler_with_shard_header_writes_one_shard(self):
+        taskmeta = self.create_task('shard0', ModelTaskMetaState.PENDING)
+        queries = self.prerun(taskmeta, {SHARD_HEADER: 'shard0'})
+        self.assertEqual(queries['shard1'], 0)
+        self.assertGreater(queries['shard0'], 0)
+
+    def test_handler_without_shard_header_writes_every_shard(self):
+        taskmeta = self.create_task('shard1', ModelTaskMetaState.PENDING)
+        queries = self.prerun(taskmeta)
+        self.assertGreater(queries['shard0'], 0)
+        self.assertGreater(queries['shard1'], 0)
+
+    def test_get_task_status(self):
+        running = self.create_task('shard1', ModelTaskMetaState.STARTED)
+        ready = self.create_task('shard1', ModelTaskMetaState.SUCCESS)
+        status = self.items['shard1'].get_task_status()
+        self.assertEqual([t['task_id'] for t in status['running_tasks']],
+                         [running.task_id])
+        self.assertEqual(status['last_ready_task']['task_id'], ready.task_id)
+        self.assertNotIn('running_tasks',
+                         self.items['shard0'].get_task_status())
+
+        statuses = self.model.objects.get_task_statuses(self.items.values())
+        self.assertEqual(
+            statuses[self.items['shard1'].pk]['last_ready_task']['task_id'],
+            ready.task_id)
+        self.assertNotIn('last_ready_task',
+                         statuses[self.items['shard0'].pk])
+
+    def test_filters_read_every_shard(self):
+        self.create_task('shard0', ModelTaskMetaState.STARTED)
+        self.create_task('shard1', ModelTaskMetaState.SUCCESS)
+        manager = self.model.objects
+        manager.create(name='idle')
+        idle = set(manager.exclude(pk__in=[i.pk for i in self.items.values()]))
+
+        self.assertEqual(set(manager.with_tasks()), set(self.items.values()))
+        self.assertEqual(set(manager.with_running_tasks()),
+                         set([self.items['shard0']]))
+        self.assertEqual(set(manager.with_ready_tasks()),
+                         set([self.items['shard1']]))
+        self.assertEqual(set(manager.without_tasks()), idle)
+        self.assertEqual(set(manager.without_running_tasks()),
+                         idle | set([self.items['shard1']]))
+
+    def create_ready_tasks(self):
+        now = timezone.now()
+        for shard in SHARDS:
+            for age in range(3):
+                self.create_task(shard, ModelTaskMetaState.SUCCESS,
+                                 updated_at=now - timedelta(days=age))
+
+    def test_prune_every_shard(self):
+        self.create_ready_tasks()
+        stats = TaskPruner(batch_size=1).prune()
+        self.assertEqual(stats['old_ready'], 4)
+        for shard in SHARDS:
+            self.assertEqual(ModelTaskMeta.objects.using(shard).count(), 1)
+
+    def test_cleanup_every_shard(self):
+        self.create_ready_tasks()
+        self.create_task('shard0', ModelTaskMetaState.STARTED)
+        stats = cleanup_tasks(batch_size=2, forget=False)
+        self.assertEqual(stats.rows, 6)
+        self.assertEqual(ModelTaskMeta.objects.using('shard0').count(), 1)
+        self.assertEqual(ModelTaskMeta.objects.using('shard1').count(), 0)
@@ -0,0 +1,121 @@
+import time
+import unittest
+import uuid
+
+from django.test import TestCase
+
+from .. import models
+from ..models import ModelTaskMeta, ModelTaskMetaState
+from ..stores import RedisStateStore
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipUnless(fakeredis, 'fakeredis is not installed')
+class RedisStateStoreTest(TestCase):
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        self.client = fakeredis.FakeRedis()
+        self.client.flushall()
+        self.store = RedisStateStore(client=self.client, ttl=60)
+        self.addCleanup(setattr, models, 'state_store', models.state_store)
+        models.state_store = self.store
+        self.item = BenchItem.objects.create(name='item')
+
+    def create_task(self, state=ModelTaskMetaState.PENDING):
+        return ModelTaskMeta.objects.create(
+            content_object=self.item, task_id=uuid.uuid4().hex, state=state)
+
+    def stored_state(self, task_id):
+        return self.store.get_states([task_id]).get(task_id)
+
+    def test_pending_does_not_overwrite_a_running_state(self):
+        task = self.create_task()
+        self.store.set_states([task.task_id], ModelTaskMetaState.PENDING)
+        self.assertEqual(self.stored_state(task.task_id),
+                         ModelTaskMetaState.PENDING)
+        self.store.set_states([task.task_id], ModelTaskMetaState.STARTED)
+        self.store.set_states([task.task_id], ModelTaskMetaState.PENDING)
+        self.assertEqual(self.stored_state(task.task_id),
+                         ModelTaskMetaState.STARTED)
+        self.store.set_states([task.task_id], ModelTaskMetaState.RETRY)
+        self.assertEqual(self.stored_state(task.task_id),
+                         ModelTaskMetaState.RETRY)
+
+    def test_running_states_stay_out_of_the_table(self):
+        task = self.create_task()
+        self.store.set_state(task.task_id, ModelTaskMetaState.STARTED)
+        self.assertEqual(ModelTaskMeta.objects.get(pk=task.pk).state,
+                         ModelTaskMetaState.PENDING)
+
+    def test_ready_states_are_written_through(self):
+        task = self.create_task()
+        self.store.set_state(task.task_id, ModelTaskMetaState.STARTED)
+        self.store.set_state(task.task_id, ModelTaskMetaState.SUCCESS)
+        self.assertEqual(ModelTaskMeta.objects.get(pk=task.pk).state,
+                         ModelTaskMetaState.SUCCESS)
+        self.assertIsNone(self.stored_state(task.task_id))
+
+    def test_delete(self):
+        task = self.create_task()
+        self.store.set_state(task.task_id, ModelTaskMetaState.STARTED)
+        self.store.delete(task.task_id)
+        self.assertFalse(ModelTaskMeta.objects.filter(pk=task.pk).exists())
+        self.assertIsNone(self.stored_state(task.task_id))
+
+    def test_load_states(self):
+        started, pending, failed = [
+            self.create_task(state) for state in (
+                ModelTaskMetaState.PENDING, ModelTaskMetaState.PENDING,
+                ModelTaskMetaState.FAILURE)]
+        self.store.set_state(started.task_id, ModelTaskMetaState.STARTED)
+        self.client.set(self.store.get_key(failed.task_id),
+                        ModelTaskMetaState.STARTED)
+
+        self.store.load_states([started, pending, failed])
+
+        self.assertEqual(started.state, ModelTaskMetaState.STARTED)
+        self.assertEqual(pending.state, ModelTaskMetaState.PENDING)
+        # ready states in the table win over a stale key
+        self.assertEqual(failed.state, ModelTaskMetaState.FAILURE)
+
+    def test_filter_states_overlays_the_table(self):
+        started, retrying, pending = [self.create_task() for _ in range(3)]
+        failed = self.create_task(ModelTaskMetaState.FAILURE)
+        self.store.set_state(started.task_id, ModelTaskMetaState.STARTED)
+        self.store.set_state(retrying.task_id, ModelTaskMetaState.RETRY)
+        self.store.set_state(pending.task_id, ModelTaskMetaState.PENDING)
+
+        def task_ids(queryset):
+            return set(queryset.values_list('task_id', flat=True))
+
+        self.assertEqual(task_ids(self.item.tasks.started()),
+                         set([started.task_id]))
+        self.assertEqual(task_ids(self.item.tasks.retrying()),
+                         set([retrying.task_id]))
+        self.assertEqual(task_ids(self.item.tasks.pending()),
+                         set([pending.task_id]))
+        self.assertEqual(
+            task_ids(self.item.tasks.running()),
+            set([started.task_id, retrying.task_id, pending.task_id]))
+        self.assertEqual(
+            task_ids(self.store.filter_states(
+                ModelTaskMeta.objects.all(),
+                (ModelTaskMetaState.STARTED, ModelTaskMetaState.FAILURE))),
+            set([started.task_id, failed.task_id]))
+
+    def test_keys_expire(self):
+        task = self.create_task()
+        self.store.set_state(task.task_id, ModelTaskMetaState.STARTED)
+        key = self.store.get_key(task.task_id)
+        self.assertTrue(0 < self.client.ttl(key) <= 60)
+
+        self.client.pexpire(key, 1)
+        time.sleep(0.01)
+
+        self.assertIsNone(self.stored_state(task.task_id))
+        self.assertEqual(set(self.item.tasks.pending()), set([task]))
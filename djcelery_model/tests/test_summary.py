@@ -0,0 +1,88 @@
+from io import StringIO
+
+from celery import states
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import ModelTaskMeta, ModelTaskMetaState, ModelTaskSummary, \
+    delete_task, handle_task_postrun, handle_task_prerun
+from .utils import djcelery_model_settings, set_workers_ready
+
+
+class TaskSummaryTest(TestCase):
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        from benchmarks.celery_app import noop
+        self.settings = djcelery_model_settings(TRACK_SUMMARY=True)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        set_workers_ready()
+        self.model = BenchItem
+        self.task = noop
+        self.item = BenchItem.objects.create(name='item')
+        self.idle = BenchItem.objects.create(name='idle')
+        self.content_type = ContentType.objects.get_for_model(BenchItem)
+
+    def get_summary(self, item=None):
+        return ModelTaskSummary.objects.get(
+            content_type=self.content_type, object_id=(item or self.item).pk)
+
+    def assert_counts(self, **counts):
+        summary = self.get_summary()
+        for field in ModelTaskSummary.objects.STATE_FIELDS.values():
+            self.assertEqual(getattr(summary, field),
+                             counts.get(field, 0), field)
+
+    def test_counters_follow_the_task(self):
+        result = self.item.apply_async(self.task)
+        self.assert_counts(pending_count=1)
+
+        handle_task_prerun(task_id=result.id)
+        self.assert_counts(started_count=1)
+
+        handle_task_postrun(task_id=result.id, state=states.SUCCESS)
+        self.assert_counts(success_count=1)
+        self.assertEqual(self.get_summary().last_ready_task_id, result.id)
+
+        delete_task(result.id)
+        self.assert_counts()
+
+    def test_apply_async_many_counts_created_tasks(self):
+        self.model.objects.apply_async_many(self.task,
+                                            instances=[self.item, self.item])
+        self.assert_counts(pending_count=2)
+
+    def test_filters_read_the_summary(self):
+        self.item.apply_async(self.task)
+        manager = self.model.objects
+        for queryset in (manager.with_running_tasks(),
+                         manager.without_running_tasks(),
+                         manager.with_tasks()):
+            sql = str(queryset.query)
+            self.assertIn(ModelTaskSummary._meta.db_table, sql)
+            self.assertNotIn(ModelTaskMeta._meta.db_table, sql)
+        self.assertEqual(list(manager.with_running_tasks()), [self.item])
+        self.assertEqual(list(manager.with_pending_tasks()), [self.item])
+        self.assertEqual(list(manager.with_ready_tasks()), [])
+        self.assertEqual(list(manager.without_tasks()), [self.idle])
+
+    def test_rebuild_fixes_drifted_counts(self):
+        result = self.item.apply_async(self.task)
+        handle_task_postrun(task_id=result.id, state=states.FAILURE)
+        self.item.apply_async(self.task)
+        ModelTaskSummary.objects.filter(pk=self.get_summary().pk).update(
+            pending_count=5, failure_count=0, last_ready_task_id='')
+        ModelTaskSummary.objects.create(content_type=self.content_type,
+                                        object_id=self.idle.pk,
+                                        started_count=1)
+        self.assertIn(self.idle, self.model.objects.with_running_tasks())
+
+        call_command('djcelery_model_rebuild_summary', stdout=StringIO())
+
+        self.assert_counts(pending_count=1, failure_count=1)
+        self.assertEqual(self.get_summary().last_ready_task_id, result.id)
+        self.assertEqual(self.get_summary(self.idle).running_count, 0)
+        self.assertEqual(list(self.model.objects.with_running_tasks()),
+                         [self.item])
@@ -0,0 +1,47 @@
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from ..models import ModelTaskMeta, ModelTaskMetaState
+from .utils import set_workers_ready
+
+
+class ApplyAsyncManyTest(TestCase):
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        from benchmarks.celery_app import noop
+        set_workers_ready()
+        self.model = BenchItem
+        self.task = noop
+        ContentType.objects.get_for_model(BenchItem)
+
+    def create_items(self, count):
+        return [self.model.objects.create(name='item %d' % i)
+                for i in range(count)]
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        # one INSERT, as long as SQLite takes all rows in one statement
+        for count in (1, 10, 50):
+            items = self.create_items(count)
+            with self.assertNumQueries(1):
+                results = self.model.objects.apply_async_many(
+                    self.task, instances=items)
+            self.assertEqual(len(results), count)
+
+    def test_task_metas_are_pending(self):
+        items = self.create_items(3)
+        results = self.model.objects.apply_async_many(self.task,
+                                                      instances=items)
+        self.assertEqual(
+            set(ModelTaskMeta.objects.pending().values_list('task_id',
+                                                            flat=True)),
+            set(result.id for result in results))
+
+    def test_republished_task_is_set_pending(self):
+        item, = self.create_items(1)
+        result = item.apply_async(self.task)
+        ModelTaskMeta.objects.filter(task_id=result.id).update(
+            state=ModelTaskMetaState.FAILURE)
+        item.apply_async(self.task, task_id=result.id)
+        self.assertEqual(ModelTaskMeta.objects.get(task_id=result.id).state,
+                         ModelTaskMetaState.PENDING)
@@ -0,0 +1,75 @@
+import json
+import uuid
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ..models import ModelTaskMeta, ModelTaskMetaState
+from ..progress import ProgressReporter
+from ..pubsub import pubsub, task_channel
+from ..views import ModelTaskStatusView
+from .utils import djcelery_model_settings
+
+
+class TaskVersionTest(TestCase):
+
+    def setUp(self):
+        from benchmarks.benchapp.models import BenchItem
+        self.item = BenchItem.objects.create(name='item')
+        self.task = ModelTaskMeta.objects.create(
+            content_object=self.item, task_id=uuid.uuid4().hex,
+            state=ModelTaskMetaState.STARTED)
+
+    def test_version_changes_with_block_ui_timeout(self):
+        ModelTaskMeta.objects.filter(pk=self.task.pk).update(
+            created_at=timezone.now() - timedelta(seconds=120))
+        self.assertNotEqual(
+            self.item.get_task_version(non_block_ui_timeout=60),
+            self.item.get_task_version(non_block_ui_timeout=3600))
+
+    def test_version_changes_with_pending_timeout(self):
+        ModelTaskMeta.objects.filter(pk=self.task.pk).update(
+            state=ModelTaskMetaState.PENDING,
+            created_at=timezone.now() - timedelta(seconds=120))
+        self.assertNotEqual(
+            self.item.get_task_version(pending_task_timeout=60),
+            self.item.get_task_version(pending_task_timeout=3600))
+
+
+class ProgressVersionTest(TestCase):
+
+    def setUp(self):
+        from django.test import RequestFactory
+        from benchmarks.benchapp.models import BenchItem
+        self.factory = RequestFactory()
+        self.view = ModelTaskStatusView.as_view(model=BenchItem)
+        self.item = BenchItem.objects.create(name='item')
+        self.task = ModelTaskMeta.objects.create(
+            content_object=self.item, task_id=uuid.uuid4().hex,
+            state=ModelTaskMetaState.STARTED)
+        ModelTaskMeta.objects.filter(pk=self.task.pk).update(
+            updated_at=timezone.now() - timedelta(seconds=60))
+
+    def get_status(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.view(self.factory.get('/', **headers), pk=self.item.pk)
+
+    def test_etag_changes_with_progress(self):
+        etag = self.get_status()['ETag']
+        self.assertEqual(self.get_status(etag).status_code, 304)
+
+        ProgressReporter(min_interval=0).report(self.task.task_id, 50)
+
+        response = self.get_status(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        status = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(status['running_tasks'][0]['progress'], 50)
+
+    def test_progress_is_notified(self):
+        channel = task_channel(self.task.content_type_id, self.item.pk)
+        notification = pubsub.version(channel)
+        with djcelery_model_settings(NOTIFY_CHANGES=True):
+            ProgressReporter(min_interval=0).report(self.task.task_id)
+        self.assertEqual(pubsub.version(channel), notification + 1)
@@ -0,0 +1,35 @@
+from django.test import SimpleTestCase
+
+from ..models import ModelTaskMetaState
+from ..writer import StateWriter
+
+
+class RecordingStateWriter(StateWriter):
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingStateWriter, self).__init__(*args, **kwargs)
+        self.applied = []
+
+    def _apply(self, transitions):
+        self.applied.append(transitions)
+
+
+class StateWriterTest(SimpleTestCase):
+
+    def test_transitions_are_coalesced(self):
+        writer = RecordingStateWriter(interval=60)
+        writer.set_state('a', ModelTaskMetaState.STARTED)
+        writer.set_state('a', ModelTaskMetaState.SUCCESS)
+        writer.flush()
+        self.assertEqual(writer.applied, [{'a': ModelTaskMetaState.SUCCESS}])
+
+    def test_forked_process_drops_inherited_buffer(self):
+        writer = RecordingStateWriter(interval=60)
+        writer.set_state('a', ModelTaskMetaState.STARTED)
+        inherited_timer = writer._timer
+        writer._pid = -1  # as seen from a forked child
+        writer.set_state('b', ModelTaskMetaState.STARTED)
+        self.assertIsNot(writer._timer, inherited_timer)
+        writer.flush()
+        inherited_timer.cancel()
+        self.assertEqual(writer.applied, [{'b': ModelTaskMetaState.STARTED}])
@@ -0,0 +1,44 @@
+"""
+Helpers shared by the django-celery-model tests.
+"""
+from django.conf import settings
+
+
+class djcelery_model_settings(object):
+    """
+    Change DJCELERY_MODEL options for the duration of a test, usable as a
+    context manager or with ``enable()`` and ``disable()``. The dict is
+    changed in place, as every djcelery_model module keeps a reference to
+    it.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.saved = None
+
+    def enable(self):
+        self.saved = dict(settings.DJCELERY_MODEL)
+        settings.DJCELERY_MODEL.update(self.options)
+
+    def disable(self):
+        settings.DJCELERY_MODEL.clear()
+        settings.DJCELERY_MODEL.update(self.saved)
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+
+def set_workers_ready():
+    """
+    Make apply_async() see a running worker without probing for one.
+    """
+    from ..status import worker_status_cache, get_worker_status_display, \
+        WORKER_READY
+    worker_status_cache.set({
+        'status_code': WORKER_READY,
+        'status': get_worker_status_display(WORKER_READY),
+    })
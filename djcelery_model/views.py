@@ -1,19 +1,156 @@
 from django.views.generic.detail import BaseDetailView
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified, \
+    StreamingHttpResponse
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.utils.http import http_date, parse_etags, quote_etag
+import calendar
+import hashlib
 import json
+import time
 from datetime import datetime
 from django.utils.timezone import utc
-from .models import ModelTaskMetaState
+from .models import ModelTaskMetaState, DJCELERY_MODEL_SETTINGS, \
+    format_task_version
+from .instrumentation import collect_timings
+from .pubsub import pubsub, task_channel
 from celery import states
 from celery.result import AsyncResult
 
 
-class ModelTaskStatusView(BaseDetailView):
+class TaskVersionMixin(object):
+    """
+    ETag and payload cache handling of the task status views, shared by
+    ModelTaskStatusView and AsyncModelTaskStatusView. Nothing here builds
+    the status itself.
+    """
+
+    def is_not_modified(self, version):
+        etags = parse_etags(self.request.META.get('HTTP_IF_NONE_MATCH', ''))
+        return version in etags or quote_etag(version) in etags
+
+    def get_cache_timeout(self):
+        return DJCELERY_MODEL_SETTINGS.get('STATUS_CACHE_TIMEOUT', 0)
+
+    def get_cached_content(self, version):
+        if self.get_cache_timeout() > 0:
+            return cache.get(self.get_cache_key(version))
+        return None
+
+    def cache_content(self, version, content, version_info):
+        timeout = self.get_cache_timeout()
+        if timeout > 0:
+            cache.set(self.get_cache_key(version), (content, version_info),
+                      timeout)
+
+    def get_cache_key(self, version):
+        content_type = ContentType.objects.get_for_model(self.object)
+        return 'djcelery_model:status:%s:%s:%s' % (
+            content_type.pk, self.object.pk,
+            hashlib.md5(version.encode('utf-8')).hexdigest())
+
+    def set_version_headers(self, response, version_info):
+        response['ETag'] = quote_etag(format_task_version(version_info))
+        if version_info['updated_at'] is not None:
+            response['Last-Modified'] = http_date(
+                calendar.timegm(version_info['updated_at'].utctimetuple()))
+        response['Cache-Control'] = 'no-cache'
+
+
+class ModelTaskStatusView(TaskVersionMixin, BaseDetailView):
+    """
+    Return the task status of an object as JSON.
+
+    Responses carry an ETag derived from get_task_version(), so that
+    conditional requests are answered with 304 Not Modified without
+    building the status. Rendered payloads are cached per version for
+    DJCELERY_MODEL['STATUS_CACHE_TIMEOUT'] seconds if it is set.
+    """
+
     def get_response_object(self):
+        if DJCELERY_MODEL_SETTINGS.get('STATUS_DEBUG', False):
+            with collect_timings() as timings:
+                task_status = self.object.get_task_status()
+            task_status['debug'] = {'timings': timings}
+            return task_status
         task_status = self.object.get_task_status()
         return task_status
 
     def render_to_response(self, context, *args, **kwargs):
-        response_object = self.get_response_object()
-        return HttpResponse(json.dumps(response_object),
-                            content_type="application/json")
+        version_info = self.object.get_task_version_info()
+        version = format_task_version(version_info)
+        if self.is_not_modified(version):
+            response = HttpResponseNotModified()
+        else:
+            content, version_info = self.get_content(version, version_info)
+            response = HttpResponse(content,
+                                    content_type="application/json")
+        self.set_version_headers(response, version_info)
+        return response
+
+    def get_content(self, version, version_info):
+        cached = self.get_cached_content(version)
+        if cached is not None:
+            return cached
+        content = json.dumps(self.get_response_object())
+        # building the status may have pruned tasks
+        if DJCELERY_MODEL_SETTINGS.get('PRUNE_ON_STATUS', True):
+            version_info = self.object.get_task_version_info()
+        self.cache_content(version, content, version_info)
+        return content, version_info
+
+
+class ModelTaskStatusStreamView(BaseDetailView):
+    """
+    Stream the task status of an object as Server-Sent Events.
+
+    The full status is sent first, afterwards only the top-level keys that
+    changed. The stream wakes up on change notifications (see
+    DJCELERY_MODEL['NOTIFY_CHANGES']) and at least every ``poll_interval``
+    seconds, but reads the status only if get_task_version() changed.
+    """
+    poll_interval = 5
+    stream_timeout = 5 * 60
+
+    def get_response_object(self):
+        return self.object.read_task_status()
+
+    def render_to_response(self, context, *args, **kwargs):
+        last_version = self.request.META.get('HTTP_LAST_EVENT_ID')
+        response = StreamingHttpResponse(self.stream(last_version),
+                                         content_type="text/event-stream")
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, last_version=None):
+        content_type = ContentType.objects.get_for_model(self.object)
+        channel = task_channel(content_type.pk, self.object.pk)
+        deadline = time.time() + self.stream_timeout
+        notification = pubsub.version(channel)
+        status = {}
+
+        while True:
+            version = self.object.get_task_version()
+            if version != last_version:
+                new_status = self.get_response_object()
+                delta = dict((key, value)
+                             for key, value in new_status.items()
+                             if status.get(key) != value)
+                for key in status:
+                    if key not in new_status:
+                        delta[key] = None
+                status, last_version = new_status, version
+                yield self.format_event(delta, version)
+            else:
+                yield ': keep-alive\n\n'
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            notification = pubsub.wait(channel, notification,
+                                       min(self.poll_interval, remaining))
+
+    def format_event(self, data, version):
+        return 'id: %s\nevent: status\ndata: %s\n\n' % (
+            version, json.dumps(data))
@@ -0,0 +1,134 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection
+from celery import signals
+
+from .instrumentation import instrument
+
+DJCELERY_MODEL_SETTINGS = getattr(settings, 'DJCELERY_MODEL', {})
+
+logger = logging.getLogger('')
+
+DELETED = object()
+
+
+class StateWriter(object):
+    """
+    Writes task state transitions from the worker signal handlers.
+
+    With a positive ``interval`` (DJCELERY_MODEL['STATE_WRITE_INTERVAL'],
+    in seconds) transitions are buffered per process, only the latest state
+    of every task is kept and the buffer is flushed with one UPDATE per
+    target state after ``interval`` seconds, once it holds ``max_size``
+    tasks, or when the worker process shuts down. Otherwise every
+    transition is written immediately.
+    """
+
+    def __init__(self, interval=None, max_size=None):
+        if interval is None:
+            interval = DJCELERY_MODEL_SETTINGS.get('STATE_WRITE_INTERVAL', 0)
+        if max_size is None:
+            max_size = DJCELERY_MODEL_SETTINGS.get(
+                'STATE_WRITE_MAX_BUFFER', 1000)
+        self.interval = interval
+        self.max_size = max_size
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+
+    def _check_fork(self):
+        # a forked worker process inherits the buffer and the lock, but not
+        # the timer thread; the parent process flushes its own transitions
+        if self._pid != os.getpid():
+            self._reset()
+
+    @property
+    def buffered(self):
+        return self.interval > 0
+
+    def set_state(self, task_id, state):
+        self._write(task_id, state)
+
+    def delete(self, task_id):
+        self._write(task_id, DELETED)
+
+    def _write(self, task_id, state):
+        if not self.buffered:
+            self._apply({task_id: state})
+            return
+        self._check_fork()
+        with self._lock:
+            self._pending[task_id] = state
+            full = len(self._pending) >= self.max_size
+            if not full:
+                self._schedule()
+        if full:
+            self.flush()
+
+    def flush(self):
+        self._check_fork()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        try:
+            self._apply(pending)
+        except Exception as e:
+            logger.error("Unable to write %d task states: %s" % (
+                len(pending), e))
+            with self._lock:
+                for task_id, state in pending.items():
+                    self._pending.setdefault(task_id, state)
+                self._schedule()
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.interval, self._flush_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_timer(self):
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+    @instrument('state_writer_flush')
+    def _apply(self, transitions):
+        from .models import set_tasks_state, delete_tasks
+
+        by_state = {}
+        for task_id, state in transitions.items():
+            by_state.setdefault(state, []).append(task_id)
+        for state, task_ids in by_state.items():
+            if state is DELETED:
+                delete_tasks(task_ids)
+            else:
+                set_tasks_state(task_ids, state)
+
+
+state_writer = StateWriter()
+
+
+@signals.worker_process_shutdown.connect
+def handle_worker_process_shutdown(**kwargs):
+    state_writer.flush()
+
+
+@signals.worker_shutdown.connect
+def handle_worker_shutdown(**kwargs):
+    state_writer.flush()
+
+
+atexit.register(state_writer.flush)